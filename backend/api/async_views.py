@@ -0,0 +1,238 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.cache import INGREDIENTS_VERSION, TAGS_VERSION, get_versions
+from api.filters import RecipeFilter
+from api.mixins import get_conditional_headers, set_conditional_headers
+from api.serializers import (IngredientSerializer, RecipeSerializer,
+                             TagSerializer)
+from api.views import (IngredientViewSet, RecipeViewSet, TagViewSet,
+                       get_ingredients, get_recipe_queryset,
+                       get_recipe_version_keys)
+from foodgram.middleware import measure
+from recipes.models import Ingredient, Recipe, Tag
+
+READ_ONLY_ACTIONS = {'get': 'list'}
+DETAIL_ACTIONS = {
+    'get': 'retrieve',
+    'put': 'update',
+    'patch': 'partial_update',
+    'delete': 'destroy',
+}
+
+
+def json_response(data, status=200):
+    # Тот же вид JSON, что у JSONRenderer в DRF.
+    with measure('render'):
+        return JsonResponse(
+            data,
+            status=status,
+            safe=False,
+            json_dumps_params={
+                'ensure_ascii': False, 'separators': (',', ':')}
+        )
+
+
+def not_found(model):
+    # Как у get_object_or_404, которым пользуется DRF.
+    return json_response(
+        {'detail': f'No {model._meta.object_name} matches the given query.'},
+        status=404
+    )
+
+
+async def get_user(request):
+    """Пользователь по токену; None — токен неверный, ответит DRF."""
+    keyword, _, key = request.headers.get('Authorization', '').partition(' ')
+    if not keyword:
+        return AnonymousUser()
+    if keyword.lower() != 'token' or not key:
+        return None
+    token = await Token.objects.select_related('user').filter(
+        key=key).afirst()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+def is_json_request(request):
+    return (
+        'format' not in request.GET
+        and 'text/html' not in request.headers.get('Accept', '')
+    )
+
+
+async def conditional(request, version_keys, etag_parts, handler, *args):
+    versions = await sync_to_async(get_versions)(version_keys)
+    etag, last_modified = get_conditional_headers(
+        versions, [request.build_absolute_uri(), 'json'] + etag_parts)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = await handler(request, *args)
+    return set_conditional_headers(response, etag, last_modified)
+
+
+async def serialize(serializer_class, instance, request, many=False):
+    return await sync_to_async(lambda: serializer_class(
+        instance, many=many, context={'request': request}).data)()
+
+
+async def paginate(request, queryset):
+    """Страница рецептов в формате постраничной выдачи DRF."""
+    paginator = PageNumberPagination
+    try:
+        page_size = int(request.GET['limit'])
+    except (KeyError, ValueError):
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    if page_size < 1:
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 0
+    count = await queryset.acount()
+    if page < 1 or (page - 1) * page_size >= max(count, 1):
+        raise NotFound(paginator.invalid_page_message)
+    start = (page - 1) * page_size
+    recipes = [recipe async for recipe in queryset[start:start + page_size]]
+    url = request.build_absolute_uri()
+    previous = None
+    if page == 2:
+        previous = remove_query_param(url, 'page')
+    elif page > 2:
+        previous = replace_query_param(url, 'page', page - 1)
+    return recipes, {
+        'count': count,
+        'next': (
+            replace_query_param(url, 'page', page + 1)
+            if start + page_size < count else None
+        ),
+        'previous': previous,
+    }
+
+
+async def list_tags(request):
+    tags = [tag async for tag in Tag.objects.all()]
+    return json_response(await serialize(TagSerializer, tags, request, True))
+
+
+async def retrieve_tag(request, pk):
+    tag = await Tag.objects.filter(pk=pk).afirst()
+    if tag is None:
+        return not_found(Tag)
+    return json_response(await serialize(TagSerializer, tag, request))
+
+
+async def list_ingredients(request):
+    try:
+        ingredients = await sync_to_async(get_ingredients)(
+            request.GET, Ingredient.objects.all())
+    except ValidationError as error:
+        return json_response(error.detail, status=400)
+    return json_response(
+        await serialize(IngredientSerializer, ingredients, request, True))
+
+
+async def retrieve_ingredient(request, pk):
+    ingredient = await Ingredient.objects.filter(pk=pk).afirst()
+    if ingredient is None:
+        return not_found(Ingredient)
+    return json_response(
+        await serialize(IngredientSerializer, ingredient, request))
+
+
+async def list_recipes(request):
+    filterset = RecipeFilter(
+        request.GET,
+        queryset=get_recipe_queryset(request.user),
+        request=request
+    )
+    if not await sync_to_async(filterset.is_valid)():
+        return json_response(filterset.errors, status=400)
+    try:
+        recipes, page = await paginate(request, filterset.qs)
+    except NotFound as error:
+        return json_response({'detail': error.detail}, status=404)
+    page['results'] = await serialize(
+        RecipeSerializer, recipes, request, True)
+    return json_response(page)
+
+
+async def retrieve_recipe(request, pk):
+    recipe = await get_recipe_queryset(request.user).filter(pk=pk).afirst()
+    if recipe is None:
+        return not_found(Recipe)
+    return json_response(await serialize(RecipeSerializer, recipe, request))
+
+
+def async_read(handler, sync_view, get_version_keys, user_etag=False):
+    """Асинхронный GET с откатом на синхронное представление DRF.
+
+    Запись, браузерный API, выдача по курсору и неверные токены
+    обрабатываются исходным ViewSet в потоке.
+    """
+    async def view(request, *args, **kwargs):
+        user = None
+        if request.method == 'GET' and is_json_request(request) and (
+                'cursor' not in request.GET):
+            user = await get_user(request)
+        if user is None:
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+        request.user = user
+        return await conditional(
+            request,
+            get_version_keys(request),
+            [str(user.pk)] if user_etag else [],
+            handler,
+            *kwargs.values()
+        )
+
+    # csrf_exempt в Django 4.2 не поддерживает асинхронные представления.
+    view.csrf_exempt = True
+    return view
+
+
+def recipe_version_keys(request):
+    return get_recipe_version_keys(request.user, request.GET)
+
+
+recipe_list = async_read(
+    list_recipes,
+    RecipeViewSet.as_view({'get': 'list', 'post': 'create'}),
+    recipe_version_keys,
+    user_etag=True
+)
+recipe_detail = async_read(
+    retrieve_recipe,
+    RecipeViewSet.as_view(DETAIL_ACTIONS),
+    recipe_version_keys,
+    user_etag=True
+)
+tag_list = async_read(
+    list_tags,
+    TagViewSet.as_view(READ_ONLY_ACTIONS),
+    lambda request: [TAGS_VERSION]
+)
+tag_detail = async_read(
+    retrieve_tag,
+    TagViewSet.as_view({'get': 'retrieve'}),
+    lambda request: [TAGS_VERSION]
+)
+ingredient_list = async_read(
+    list_ingredients,
+    IngredientViewSet.as_view(READ_ONLY_ACTIONS),
+    lambda request: [INGREDIENTS_VERSION]
+)
+ingredient_detail = async_read(
+    retrieve_ingredient,
+    IngredientViewSet.as_view({'get': 'retrieve'}),
+    lambda request: [INGREDIENTS_VERSION]
+)
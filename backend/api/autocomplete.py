@@ -0,0 +1,64 @@
+import threading
+from bisect import bisect_left
+
+from api.cache import INGREDIENTS_VERSION, get_versions
+from recipes.models import Ingredient
+
+
+class IngredientIndex:
+    """Подсказки по названию ингредиента без обращения к базе.
+
+    Названия хранятся отсортированными в нижнем регистре: совпадения по
+    началу строки ищутся бинарным поиском, затем добавляются совпадения
+    по вхождению. Индекс перестраивается, когда меняется версия
+    ингредиентов в кэше: с общим кэшем изменения видны во всех процессах
+    сразу, с кэшем в памяти процесса — после CACHE_VERSION_TIMEOUT.
+    Версия, названия и ингредиенты лежат в одном кортеже и заменяются
+    целиком, поэтому поиск без блокировки не смешает старый индекс с
+    новым.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = (None, (), ())
+
+    def _build(self):
+        ingredients = sorted(
+            Ingredient.objects.all(),
+            key=lambda ingredient: (ingredient.name.casefold(), ingredient.pk)
+        )
+        return (
+            tuple(ingredient.name.casefold() for ingredient in ingredients),
+            tuple(ingredients)
+        )
+
+    def _get_actual(self):
+        version = get_versions([INGREDIENTS_VERSION])[INGREDIENTS_VERSION]
+        index = self._index
+        if index[0] != version:
+            with self._lock:
+                index = self._index
+                if index[0] != version:
+                    index = self._index = (version, *self._build())
+        _, names, ingredients = index
+        return names, ingredients
+
+    def search(self, query, limit=None):
+        query = query.casefold()
+        names, ingredients = self._get_actual()
+        start = bisect_left(names, query)
+        end = start
+        while end < len(names) and names[end].startswith(query):
+            end += 1
+        result = list(ingredients[start:end])
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+        for name, ingredient in zip(names, ingredients):
+            if query in name and not name.startswith(query):
+                result.append(ingredient)
+                if limit is not None and len(result) >= limit:
+                    break
+        return result
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,172 @@
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+from django.test import override_settings
+
+from recipes.models import Recipe, RecipeIngredient
+
+User = get_user_model()
+
+WORDS = (
+    'быстрый', 'домашний', 'запечённый', 'жареный', 'летний', 'острый',
+    'пирог', 'салат', 'суп', 'рагу', 'омлет', 'каша', 'соус', 'десерт',
+    'с', 'по-деревенски', 'без', 'духовке', 'сковороде', 'гарниром',
+)
+BATCH_SIZE = 2000
+# Лимит, которого замеры не достигают: проверка выполняется, но не
+# отказывает.
+UNLIMITED_RATE = f'{10 ** 9}/s'
+
+
+class Rollback(Exception):
+    """Откатывает транзакцию с данными для замера."""
+
+
+def get_words(count):
+    return ' '.join(random.choices(WORDS, k=count))
+
+
+def create_recipes(count, ingredients, ingredients_per_recipe=(3, 12)):
+    """Синтетические рецепты одного автора пачками по BATCH_SIZE."""
+    author = User.objects.create(
+        username='benchmark', email='benchmark@example.com')
+    for start in range(0, count, BATCH_SIZE):
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=author,
+                name=get_words(3)[:200],
+                text=get_words(40),
+                image='recipes/images/benchmark.png',
+                cooking_time=random.randint(1, 180),
+            ) for _ in range(min(BATCH_SIZE, count - start))
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient=ingredient,
+                amount=random.randint(1, 500)
+            )
+            for recipe in recipes
+            for ingredient in random.sample(
+                ingredients, random.randint(*ingredients_per_recipe))
+        )
+
+
+def measure(search, queries):
+    """Среднее время запроса в миллисекундах."""
+    start = time.perf_counter()
+    for query in queries:
+        search(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def percentile(values, share):
+    """Перцентиль по отсортированному списку."""
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def start_gunicorn(port, workers, **environment):
+    """gunicorn с конфигурацией проекта на локальном порту."""
+    environment = dict(
+        os.environ,
+        GUNICORN_WORKERS=str(workers),
+        ALLOWED_HOSTS=' '.join(settings.ALLOWED_HOSTS + ['127.0.0.1']),
+        **environment
+    )
+    try:
+        server = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn',
+                '--config', str(settings.BASE_DIR / 'gunicorn.conf.py'),
+                '--bind', f'127.0.0.1:{port}',
+                '--log-level', 'warning',
+            ],
+            cwd=settings.BASE_DIR,
+            env=environment,
+        )
+    except OSError as error:
+        raise CommandError(f'Не удалось запустить gunicorn: {error}')
+    if not wait_for_port(port):
+        server.terminate()
+        server.wait()
+        raise CommandError('Сервер не запустился')
+    return server
+
+
+def get_throttle_environment(rate):
+    """Переменные окружения с одним лимитом для всех областей."""
+    return {
+        f'THROTTLE_{scope.upper()}': rate or ''
+        for scope in settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']
+    }
+
+
+def override_throttle_rates(rate):
+    """Один лимит для всех областей, None — без лимита."""
+    return override_settings(REST_FRAMEWORK=dict(
+        settings.REST_FRAMEWORK,
+        DEFAULT_THROTTLE_RATES=dict.fromkeys(
+            settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], rate)
+    ))
+
+
+# Токен /api/_metrics для сервера, который запускают замеры.
+BENCHMARK_METRICS_TOKEN = 'benchmark'
+
+
+class ServerTransport:
+    """HTTP-запросы к локальному gunicorn."""
+
+    def __init__(self, workers):
+        self.port = get_free_port()
+        self.server = start_gunicorn(
+            self.port, workers, METRICS_TOKEN=BENCHMARK_METRICS_TOKEN,
+            **get_throttle_environment(UNLIMITED_RATE)
+        )
+
+    def send(self, method, path, data=None, token=None, authorization=None):
+        request = Request(
+            f'http://127.0.0.1:{self.port}{path}',
+            data=json.dumps(data).encode() if data is not None else None,
+            method=method,
+            headers={'Content-Type': 'application/json'}
+        )
+        if token:
+            authorization = f'Token {token}'
+        if authorization:
+            request.add_header('Authorization', authorization)
+        try:
+            with urlopen(request, timeout=60) as response:
+                return response.status, response.read(), response.headers
+        except HTTPError as error:
+            return error.code, error.read(), error.headers
+
+    def close(self):
+        self.server.terminate()
+        self.server.wait()
@@ -0,0 +1,128 @@
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+
+from api.constants import RECIPE_CACHE_TIMEOUT
+
+INGREDIENTS_VERSION = 'ingredients-version'
+POPULARITY_VERSION = 'popularity-version'
+RECIPES_VERSION = 'recipes-version'
+TAGS_VERSION = 'tags-version'
+USERS_VERSION = 'users-version'
+
+
+def recipe_version_key(recipe_id):
+    return f'recipe-version:{recipe_id}'
+
+
+def user_version_key(user_id):
+    return f'user-version:{user_id}'
+
+
+def user_flags_version_key(user_id):
+    return f'user-flags-version:{user_id}'
+
+
+def feed_version_key(user_id):
+    return f'feed-version:{user_id}'
+
+
+def is_cache_shared():
+    """Видят ли другие процессы изменения в кэше по умолчанию."""
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache)
+
+
+def get_local_cache_notice():
+    """Предупреждение для команд manage.py при кэше в памяти процесса."""
+    if is_cache_shared():
+        return ''
+    return (
+        f'Кэш хранится в памяти процесса: работающие серверы увидят '
+        f'изменения в течение {settings.CACHE_VERSION_TIMEOUT} с'
+    )
+
+
+def get_versions(keys):
+    """Текущие версии ключей, отсутствующие заводятся заново.
+
+    Версия — время последнего изменения в наносекундах: после вытеснения
+    или истечения ключа не вернуться к уже выданной версии, а по версии
+    можно отдавать Last-Modified. Срок жизни версий —
+    CACHE_VERSION_TIMEOUT.
+    """
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=settings.CACHE_VERSION_TIMEOUT)
+        versions.update(missing)
+    return versions
+
+
+def bump_version(key):
+    cache.set(key, time.time_ns(), timeout=settings.CACHE_VERSION_TIMEOUT)
+
+
+def bump_versions(keys):
+    version = time.time_ns()
+    cache.set_many(
+        {key: version for key in keys},
+        timeout=settings.CACHE_VERSION_TIMEOUT
+    )
+
+
+def bump_version_on_commit(key):
+    """Сбрасывает версию сразу и ещё раз после фиксации транзакции.
+
+    Повторный сброс не даёт закэшировать данные, прочитанные другим
+    запросом до коммита, под уже новой версией.
+    """
+    bump_version(key)
+    transaction.on_commit(lambda: bump_version(key))
+
+
+def get_recipe_payloads(recipes, serializer, variant):
+    """Сериализованные рецепты с флагами пользователя из запроса.
+
+    Общая для всех пользователей часть ответа берётся из кэша по ключу
+    с вариантом представления и версиями рецепта, автора, тегов и
+    ингредиентов; промахи сериализуются одним проходом и сохраняются
+    обратно.
+    """
+    request = serializer.context['request']
+    version_keys = {INGREDIENTS_VERSION, TAGS_VERSION}
+    for recipe in recipes:
+        version_keys.add(recipe_version_key(recipe.pk))
+        version_keys.add(user_version_key(recipe.author_id))
+    versions = get_versions(list(version_keys))
+    host = request.build_absolute_uri('/')
+    keys = {
+        recipe.pk: 'recipe:{}:{}:{}:{}:{}:{}:{}'.format(
+            variant,
+            recipe.pk,
+            versions[recipe_version_key(recipe.pk)],
+            versions[user_version_key(recipe.author_id)],
+            versions[TAGS_VERSION],
+            versions[INGREDIENTS_VERSION],
+            host
+        ) for recipe in recipes
+    }
+    payloads = cache.get_many(keys.values())
+    misses = [recipe for recipe in recipes if keys[recipe.pk] not in payloads]
+    if misses:
+        prefetch_related_objects(
+            misses, 'tags', 'recipe_ingredients__ingredient')
+        fresh = {
+            keys[recipe.pk]: serializer.to_shared_representation(
+                recipe, variant)
+            for recipe in misses
+        }
+        cache.set_many(fresh, timeout=RECIPE_CACHE_TIMEOUT)
+        payloads.update(fresh)
+    return [
+        serializer.add_user_flags(payloads[keys[recipe.pk]], recipe)
+        for recipe in recipes
+    ]
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from api.cache import is_cache_shared
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if settings.DEBUG or is_cache_shared():
+        return []
+    return [Warning(
+        'Кэш по умолчанию хранится в памяти процесса: воркеры и команды '
+        'manage.py не видят изменений друг друга, данные обновляются '
+        f'только через CACHE_VERSION_TIMEOUT = '
+        f'{settings.CACHE_VERSION_TIMEOUT} с.',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION общего кэша, '
+             'например Redis или Memcached.',
+        id='api.W001',
+    )]
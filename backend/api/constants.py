@@ -1,2 +1,23 @@
 AMOUNT_MIN = 1
 AMOUNT_MAX = 5000
+RECIPE_CACHE_TIMEOUT = 60 * 60 * 24
+MATCH_LIMIT = 20
+MATCH_MAX_LIMIT = 100
+MATCHING_CHANGE_TIMEOUT = 60 * 60 * 24
+MATCHING_MAX_PENDING = 1000
+LIST_IMAGE_WIDTH = 640
+SHORT_IMAGE_WIDTH = 320
+IMAGE_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_MAX_SIDE = 6000
+IMAGE_DECODE_CHUNK = 64 * 1024
+IMAGE_SPOOL_SIZE = 1024 * 1024
+IMAGE_VERIFY_WORKERS = 4
+IMAGE_VERIFY_TIMEOUT = 10
+FEED_CACHE_TIMEOUT = 60
+FEED_HEAVY_FOLLOWING = 50
+SIMILAR_LIMIT = 10
+RECOMMENDED_LIMIT = 20
+RECOMMENDATION_MAX_LIMIT = 100
+RECOMMENDATION_TAG_WEIGHT = 0.5
+RECOMMENDATION_FAVORITES = 200
+RECOMMENDATION_KEEP_BUILDS = 2
@@ -0,0 +1,142 @@
+import base64
+import binascii
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from api.constants import (IMAGE_DECODE_CHUNK, IMAGE_MAX_SIDE, IMAGE_MAX_SIZE,
+                           IMAGE_SPOOL_SIZE, IMAGE_VERIFY_TIMEOUT,
+                           IMAGE_VERIFY_WORKERS)
+
+
+def build_url(request, url):
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+class ThumbnailsField(serializers.ReadOnlyField):
+    """Ссылки на миниатюры изображения рецепта по ширине."""
+
+    def to_representation(self, thumbnails):
+        request = self.context.get('request')
+        return {
+            width: build_url(request, default_storage.url(name))
+            for width, name in thumbnails.items()
+        }
+
+
+class ThumbnailField(serializers.ReadOnlyField):
+    """Ссылка на миниатюру нужной ширины, пока её нет — на оригинал."""
+
+    def __init__(self, width, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+        self.width = width
+
+    def to_representation(self, recipe):
+        name = recipe.thumbnails.get(str(self.width))
+        url = default_storage.url(name) if name else recipe.image.url
+        return build_url(self.context.get('request'), url)
+
+
+class LimitedBase64ImageField(Base64ImageField):
+    """Base64ImageField, проверяющий ограничения до полного декодирования.
+
+    Размер файла известен по длине строки, размеры изображения читаются
+    из заголовка в первом куске. Остальное декодируется кусками во
+    временный файл, а проверка Pillow выполняется в ограниченном пуле
+    потоков.
+    """
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_size} МБ.',
+        'too_many_pixels': (
+            'Стороны изображения не должны превышать {max_side} пикселей.'),
+        'busy': 'Сервер перегружен, повторите загрузку позже.',
+    }
+
+    def to_internal_value(self, data):
+        if data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(data, str):
+            self.fail('invalid_image')
+        if ';base64,' in data:
+            data = data.split(';base64,', 1)[1]
+        size = len(data) // 4 * 3 - data[-2:].count('=')
+        if len(data) % 4 or size <= 0:
+            self.fail('invalid_image')
+        if size > IMAGE_MAX_SIZE:
+            self.fail('too_large', max_size=IMAGE_MAX_SIZE // 1024 // 1024)
+        head = self.decode(data[:IMAGE_DECODE_CHUNK])
+        extension = self.get_file_extension(None, head)
+        if extension not in self.ALLOWED_TYPES:
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        self.check_dimensions(head)
+        file = SpooledTemporaryFile(max_size=IMAGE_SPOOL_SIZE)
+        file.write(head)
+        for start in range(IMAGE_DECODE_CHUNK, len(data), IMAGE_DECODE_CHUNK):
+            file.write(self.decode(data[start:start + IMAGE_DECODE_CHUNK]))
+        upload = UploadedFile(
+            file=file,
+            name=f'{self.get_file_name(None)}.{extension}',
+            size=size
+        )
+        self.verify(upload)
+        return serializers.FileField.to_internal_value(self, upload)
+
+    def decode(self, chunk):
+        try:
+            return base64.b64decode(chunk, validate=True)
+        except binascii.Error:
+            self.fail('invalid_image')
+
+    def check_dimensions(self, head):
+        try:
+            with Image.open(BytesIO(head)) as image:
+                width, height = image.size
+        except (OSError, Image.DecompressionBombError):
+            # Заголовок не поместился в первый кусок: размеры проверятся
+            # вместе с целостностью файла.
+            return
+        if max(width, height) > IMAGE_MAX_SIDE:
+            self.fail('too_many_pixels', max_side=IMAGE_MAX_SIDE)
+
+    def verify(self, upload):
+        if not verify_slots.acquire(timeout=IMAGE_VERIFY_TIMEOUT):
+            self.fail('busy')
+        future = verify_executor.submit(verify_image, upload.file)
+        future.add_done_callback(lambda future: verify_slots.release())
+        try:
+            size = future.result(timeout=IMAGE_VERIFY_TIMEOUT)
+        except TimeoutError:
+            self.fail('busy')
+        except (OSError, SyntaxError, ValueError,
+                Image.DecompressionBombError):
+            self.fail('invalid_image')
+        if max(size) > IMAGE_MAX_SIDE:
+            self.fail('too_many_pixels', max_side=IMAGE_MAX_SIDE)
+
+
+def verify_image(file):
+    """Размеры изображения после проверки его целостности Pillow."""
+    file.seek(0)
+    with Image.open(file) as image:
+        size = image.size
+        if max(size) <= IMAGE_MAX_SIDE:
+            image.verify()
+    file.seek(0)
+    return size
+
+
+verify_executor = ThreadPoolExecutor(
+    max_workers=IMAGE_VERIFY_WORKERS,
+    thread_name_prefix='image-verify'
+)
+# Запросы сверх числа потоков ждут освобождения места, а не копят очередь.
+verify_slots = threading.BoundedSemaphore(IMAGE_VERIFY_WORKERS)
@@ -1,6 +1,7 @@
 from django_filters.rest_framework import FilterSet, filters
 
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
 
 
 class IngredientFilter(FilterSet):
@@ -21,6 +22,10 @@ class RecipeFilter(FilterSet):
         method='filter_by_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_by_shopping_cart')
+    search = filters.CharFilter(method='filter_by_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'popular'),),
+        method='filter_ordering')
 
     class Meta:
         model = Recipe
@@ -28,15 +33,25 @@ class RecipeFilter(FilterSet):
             'tags',
             'author',
             'is_favorited',
-            'is_in_shopping_cart'
+            'is_in_shopping_cart',
+            'search',
+            'ordering'
         )
 
     def filter_by_shopping_cart(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(shopping_list__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
 
     def filter_by_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(favorites__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        if value == 'popular':
+            return queryset.order_by('-favorites_count', '-pub_date', '-id')
+        return queryset
+
+    def filter_by_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
@@ -0,0 +1,384 @@
+import base64
+import io
+import json
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from statistics import median_low
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import get_resolver, resolve
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.benchmarks import (BENCHMARK_METRICS_TOKEN, UNLIMITED_RATE, Rollback,
+                            ServerTransport, override_throttle_rates,
+                            percentile)
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Follow
+
+User = get_user_model()
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+# Маршруты для управления учётной записью меряют в основном хэширование
+# пароля и отправку писем.
+EXCLUDED_ROUTES = {
+    'login', 'logout', 'users-activation', 'users-resend-activation',
+    'users-reset-password', 'users-reset-password-confirm',
+    'users-reset-username', 'users-reset-username-confirm',
+    'users-set-password', 'users-set-username',
+}
+
+
+class TestClientTransport:
+    """Запросы через тестовый клиент Django в этом же процессе."""
+
+    def __init__(self):
+        self.client = Client()
+
+    def send(self, method, path, data=None, token=None, authorization=None):
+        if token:
+            authorization = f'Token {token}'
+        headers = (
+            {'HTTP_AUTHORIZATION': authorization} if authorization else {})
+        response = self.client.generic(
+            method, path,
+            json.dumps(data) if data is not None else '',
+            content_type='application/json', **headers
+        )
+        return response.status_code, response.getvalue(), response
+
+    def close(self):
+        pass
+
+
+def get_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), '#E26C2D').save(buffer, 'PNG')
+    return (f'data:image/png;base64,'
+            f'{base64.b64encode(buffer.getvalue()).decode()}')
+
+
+def get_fixtures():
+    """Пользователь, авторы и рецепты, на которых идут запросы."""
+    user = User.objects.annotate(
+        follows=Count('follower')).order_by('-follows', 'pk').first()
+    recipe = Recipe.objects.order_by('-favorites_count', 'pk').first()
+    if user is None or recipe is None:
+        raise CommandError('В базе нет данных, выполните generate_data')
+    free_recipe = Recipe.objects.exclude(
+        pk__in=Favorite.objects.filter(user=user).values('recipe')
+    ).exclude(
+        pk__in=ShoppingCart.objects.filter(user=user).values('recipe')
+    ).order_by('-favorites_count', 'pk').first()
+    free_author = User.objects.exclude(
+        pk__in=Follow.objects.filter(user=user).values('author')
+    ).exclude(pk=user.pk).order_by('-followers_count', 'pk').first()
+    ingredients = list(recipe.recipe_ingredients.values_list(
+        'ingredient_id', 'ingredient__name')[:5])
+    tag = Tag.objects.order_by('pk').first()
+    return {
+        'token': Token.objects.get_or_create(user=user)[0].key,
+        'author': recipe.author_id,
+        'free_author': free_author.pk,
+        'recipe': recipe.pk,
+        'free_recipe': free_recipe.pk,
+        'tag': tag.slug if tag else '',
+        'tag_id': tag.pk if tag else None,
+        'ingredient': ingredients[0][0],
+        'ingredients': ','.join(str(pk) for pk, _ in ingredients),
+        'ingredient_name': quote(ingredients[0][1][:3]),
+        'word': quote(recipe.name.split()[0]),
+    }
+
+
+def get_scenarios(fixtures, writes):
+    """Группы шагов: шаги группы идут по порядку на каждой итерации.
+
+    Шаг — (название, метод, путь, тело, с токеном ли). Парные запросы на
+    запись возвращают данные в исходное состояние.
+    """
+    groups = [
+        [('api-root', 'GET', '/api/', None, False)],
+        [('users-list', 'GET', '/api/users/', None, False)],
+        [('users-detail', 'GET', '/api/users/{author}/', None, True)],
+        [('users-me', 'GET', '/api/users/me/', None, True)],
+        [('users-subscriptions', 'GET',
+          '/api/users/subscriptions/?recipes_limit=3', None, True)],
+        [('tags-list', 'GET', '/api/tags/', None, False)],
+        [('ingredients-list', 'GET', '/api/ingredients/', None, False)],
+        [('ingredients-search', 'GET',
+          '/api/ingredients/?name={ingredient_name}', None, False)],
+        [('ingredients-detail', 'GET', '/api/ingredients/{ingredient}/',
+          None, False)],
+        [('recipes-list', 'GET', '/api/recipes/', None, False)],
+        [('recipes-list-auth', 'GET', '/api/recipes/', None, True)],
+        [('recipes-list-popular', 'GET', '/api/recipes/?ordering=popular',
+          None, True)],
+        [('recipes-list-favorited', 'GET', '/api/recipes/?is_favorited=1',
+          None, True)],
+        [('recipes-list-tags', 'GET', '/api/recipes/?tags={tag}', None,
+          True)],
+        [('recipes-list-search', 'GET', '/api/recipes/?search={word}', None,
+          True)],
+        [('recipes-detail', 'GET', '/api/recipes/{recipe}/', None, True)],
+        [('recipes-feed', 'GET', '/api/recipes/feed/', None, True)],
+        [('recipes-similar', 'GET', '/api/recipes/{recipe}/similar/', None,
+          True)],
+        [('recipes-recommended', 'GET', '/api/recipes/recommended/', None,
+          True)],
+        [('recipes-match', 'GET', '/api/recipes/match/?ingredients='
+          '{ingredients}', None, True)],
+        [('recipes-download-shopping-cart', 'GET',
+          '/api/recipes/download_shopping_cart/', None, True)],
+        [('metrics', 'GET', '/api/_metrics', None, 'metrics')],
+    ]
+    if fixtures['tag_id'] is not None:
+        groups.append(
+            [('tags-detail', 'GET', '/api/tags/{tag_id}/', None, False)])
+    if not writes:
+        return groups
+    recipe = {
+        'ingredients': [{'id': fixtures['ingredient'], 'amount': 10}],
+        'tags': [fixtures['tag_id']] if fixtures['tag_id'] else [],
+        'image': get_image(),
+        'name': 'Тестовый рецепт',
+        'text': 'Описание',
+        'cooking_time': 10,
+    }
+    return groups + [
+        [
+            ('users-subscribe-create', 'POST',
+             '/api/users/{free_author}/subscribe/', None, True),
+            ('users-subscribe-delete', 'DELETE',
+             '/api/users/{free_author}/subscribe/', None, True),
+        ],
+        [
+            ('recipes-favorite-create', 'POST',
+             '/api/recipes/{free_recipe}/favorite/', None, True),
+            ('recipes-favorite-delete', 'DELETE',
+             '/api/recipes/{free_recipe}/favorite/', None, True),
+        ],
+        [
+            ('recipes-shopping-cart-create', 'POST',
+             '/api/recipes/{free_recipe}/shopping_cart/', None, True),
+            ('recipes-shopping-cart-delete', 'DELETE',
+             '/api/recipes/{free_recipe}/shopping_cart/', None, True),
+        ],
+        [
+            ('recipes-create', 'POST', '/api/recipes/', recipe, True),
+            ('recipes-update', 'PATCH', '/api/recipes/{created}/',
+             dict(recipe, name='Изменённый рецепт'), True),
+            ('recipes-delete', 'DELETE', '/api/recipes/{created}/', None,
+             True),
+        ],
+    ]
+
+
+def get_api_routes():
+    _, resolver = get_resolver().namespace_dict['api']
+    return {name for name in resolver.reverse_dict if isinstance(name, str)}
+
+
+def get_queries(headers):
+    match = QUERIES.search(headers.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
+
+
+def summarize(method, path, latencies, queries, errors):
+    latencies = sorted(latencies)
+    queries = [count for count in queries if count is not None]
+    return {
+        'method': method,
+        'path': path,
+        'route': resolve(path.split('?')[0]).view_name,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / sum(latencies), 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'queries': median_low(queries) if queries else None,
+        'queries_max': max(queries) if queries else None,
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет все маршруты API на данных из generate_data: запросов '
+        'в секунду, p50 и p99, число SQL-запросов; сохраняет JSON и '
+        'сравнивает с прошлым замером'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--transport', default='client', choices=('client', 'gunicorn'),
+            help='Тестовый клиент Django в процессе или локальный gunicorn')
+        parser.add_argument('--workers', default=1, type=int)
+        parser.add_argument('--iterations', default=30, type=int)
+        parser.add_argument('--warmup', default=2, type=int)
+        parser.add_argument(
+            '--read-only', action='store_true',
+            help='Без запросов на запись')
+        parser.add_argument('--output', default='benchmark-api.json')
+        parser.add_argument(
+            '--compare',
+            help='JSON прошлого замера; рост числа SQL-запросов — ошибка')
+
+    def run_group(self, transport, group, fixtures, options):
+        results = {
+            name: {'latencies': [], 'queries': [], 'errors': 0}
+            for name, *_ in group
+        }
+        # True — токен пользователя, 'metrics' — токен метрик.
+        authorizations = {
+            True: f'Token {fixtures["token"]}',
+            'metrics': f'Bearer {BENCHMARK_METRICS_TOKEN}',
+        }
+        for iteration in range(options['warmup'] + options['iterations']):
+            state = dict(fixtures)
+            for name, method, path, data, auth in group:
+                start = time.perf_counter()
+                status, body, headers = transport.send(
+                    method, path.format(**state), data,
+                    authorization=authorizations.get(auth)
+                )
+                elapsed = time.perf_counter() - start
+                if status == 201:
+                    state['created'] = json.loads(body).get('id')
+                if iteration < options['warmup']:
+                    continue
+                result = results[name]
+                result['latencies'].append(elapsed)
+                result['queries'].append(get_queries(headers))
+                result['errors'] += status >= 400
+        return {
+            name: summarize(
+                method, path.format(**fixtures, created=0),
+                results[name]['latencies'], results[name]['queries'],
+                results[name]['errors']
+            )
+            for name, method, path, *_ in group
+        }
+
+    def run(self, transport, fixtures, options):
+        results = {}
+        for group in get_scenarios(fixtures, not options['read_only']):
+            results.update(
+                self.run_group(transport, group, fixtures, options))
+        return results
+
+    def run_in_process(self, fixtures, options):
+        setup_test_environment()
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(
+                        MEDIA_ROOT=media_root,
+                        METRICS_TOKEN=BENCHMARK_METRICS_TOKEN), \
+                    override_throttle_rates(UNLIMITED_RATE):
+                # Все изменения откатываются, база остаётся прежней.
+                with transaction.atomic():
+                    results = self.run(TestClientTransport(), fixtures,
+                                       options)
+                    raise Rollback
+        except Rollback:
+            return results
+        finally:
+            teardown_test_environment()
+
+    def run_on_server(self, fixtures, options):
+        transport = ServerTransport(options['workers'])
+        try:
+            return self.run(transport, fixtures, options)
+        finally:
+            transport.close()
+
+    def compare(self, report, filename):
+        with open(filename, encoding='utf-8') as file:
+            previous = json.load(file)
+        if previous['transport'] != report['transport']:
+            # Тестовый клиент работает внутри транзакции, и каждый
+            # atomic() в коде добавляет запросы SAVEPOINT.
+            raise CommandError('Замеры сделаны разными способами')
+        results = report['results']
+        previous = previous['results']
+        regressions = []
+        for name, result in results.items():
+            old = previous.get(name)
+            if old is None:
+                continue
+            change = (result['p50_ms'] / old['p50_ms'] - 1) * 100
+            self.stdout.write(
+                f'{name}: p50 {old["p50_ms"]} → {result["p50_ms"]} мс '
+                f'({change:+.0f}%), SQL {old["queries"]} → '
+                f'{result["queries"]}'
+            )
+            if (old['queries'] is not None and result['queries'] is not None
+                    and result['queries'] > old['queries']):
+                regressions.append(name)
+        if regressions:
+            raise CommandError(
+                f'Выросло число SQL-запросов: {", ".join(regressions)}')
+
+    def handle(self, *args, **options):
+        fixtures = get_fixtures()
+        if options['transport'] == 'client':
+            results = self.run_in_process(fixtures, options)
+        else:
+            results = self.run_on_server(fixtures, options)
+        routes = get_api_routes()
+        uncovered = sorted(
+            routes - EXCLUDED_ROUTES
+            - {result['route'].split(':', 1)[1] for result in results.values()}
+        )
+        report = {
+            'commit': get_commit(),
+            'created': timezone.now().isoformat(),
+            'transport': options['transport'],
+            'database': connection.vendor,
+            'python': sys.version.split()[0],
+            'iterations': options['iterations'],
+            'data': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+                'favorites': Favorite.objects.count(),
+                'carts': ShoppingCart.objects.count(),
+                'follows': Follow.objects.count(),
+            },
+            'uncovered_routes': uncovered,
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name}: {result["rps"]} rps, p50 {result["p50_ms"]} мс, '
+                f'p99 {result["p99_ms"]} мс, SQL {result["queries"]}, '
+                f'ошибок {result["errors"]}'
+            )
+        if uncovered:
+            self.stdout.write(f'Без замера: {", ".join(uncovered)}')
+        if options['compare']:
+            self.compare(report, options['compare'])
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает запросы с новым соединением на каждый запрос и с '
+        'постоянным соединением с проверкой работоспособности'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', default=200, type=int)
+
+    def simulate_request(self):
+        # Как между запросами: Django закрывает устаревшие соединения в
+        # начале и в конце каждого запроса.
+        close_old_connections()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        close_old_connections()
+
+    def measure(self, conn_max_age, health_checks, requests):
+        settings_dict = connection.settings_dict
+        saved = settings_dict['CONN_MAX_AGE'], settings_dict[
+            'CONN_HEALTH_CHECKS']
+        settings_dict['CONN_MAX_AGE'] = conn_max_age
+        settings_dict['CONN_HEALTH_CHECKS'] = health_checks
+        connection.close()
+        try:
+            start = time.perf_counter()
+            for _ in range(requests):
+                self.simulate_request()
+            return (time.perf_counter() - start) / requests * 1000
+        finally:
+            connection.close()
+            settings_dict['CONN_MAX_AGE'], settings_dict[
+                'CONN_HEALTH_CHECKS'] = saved
+
+    def handle(self, *args, **options):
+        requests = options['requests']
+        self.stdout.write(
+            f'База: {connection.vendor}, '
+            f'{connection.settings_dict.get("HOST") or "локально"}, '
+            f'запросов: {requests}'
+        )
+        for title, conn_max_age, health_checks in (
+            ('Новое соединение на запрос', 0, False),
+            ('Постоянное соединение', None, False),
+            ('Постоянное соединение с проверкой', None, True),
+        ):
+            self.stdout.write(
+                f'{title}: '
+                f'{self.measure(conn_max_age, health_checks, requests):.3f}'
+                f' мс на запрос'
+            )
@@ -0,0 +1,89 @@
+import base64
+import multiprocessing
+import os
+import resource
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+
+from api.fields import LimitedBase64ImageField
+
+FIELDS = {
+    'base64': Base64ImageField,
+    'limited': LimitedBase64ImageField,
+}
+
+
+def make_payload(megabytes):
+    """PNG из случайных пикселей: не сжимается, размер близок к заданному."""
+    side = int((megabytes * 1024 * 1024 / 3) ** 0.5)
+    buffer = BytesIO()
+    Image.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(
+        buffer, 'PNG', compress_level=1)
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+def upload(field, payload):
+    start = time.perf_counter()
+    field.to_internal_value(payload)
+    return time.perf_counter() - start
+
+
+def run(field_name, payload, concurrency, uploads, connection):
+    field = FIELDS[field_name]()
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(
+            lambda _: upload(field, payload), range(uploads)))
+    connection.send((
+        time.perf_counter() - start,
+        latencies,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает декодирование изображений base64 при одновременных '
+        'загрузках: время и прирост памяти процесса'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', default=9.5, type=float,
+                            help='Размер изображения, МБ')
+        parser.add_argument('--concurrency', default=8, type=int)
+        parser.add_argument('--uploads', default=32, type=int)
+
+    def handle(self, *args, **options):
+        payload = make_payload(options['size'])
+        self.stdout.write(
+            f'Строка base64: {len(payload) / 1024 / 1024:.1f} МБ, '
+            f'потоков: {options["concurrency"]}, '
+            f'загрузок: {options["uploads"]}'
+        )
+        context = multiprocessing.get_context('fork')
+        for field_name in FIELDS:
+            receiver, sender = context.Pipe(duplex=False)
+            # Отдельный процесс на каждое поле, чтобы пик памяти одного
+            # замера не влиял на другой.
+            process = context.Process(target=run, args=(
+                field_name, payload, options['concurrency'],
+                options['uploads'], sender
+            ))
+            process.start()
+            total, latencies, rss = receiver.recv()
+            process.join()
+            latencies.sort()
+            self.stdout.write(
+                f'{field_name}: всего {total:.2f} с, '
+                f'медиана {statistics.median(latencies) * 1000:.0f} мс, '
+                f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f}'
+                f' мс, прирост памяти {rss / 1024:.0f} МБ'
+            )
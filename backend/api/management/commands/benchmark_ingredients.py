@@ -0,0 +1,44 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.autocomplete import ingredient_index
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает поиск ингредиентов через индекс и через ORM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', default=1000, type=int)
+        parser.add_argument('--limit', default=None, type=int)
+
+    def measure(self, search, prefixes):
+        start = time.perf_counter()
+        for prefix in prefixes:
+            search(prefix)
+        return (time.perf_counter() - start) / len(prefixes) * 1000
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            raise CommandError('В базе нет ингредиентов, выполните load_to_db')
+        prefixes = [
+            name[:random.randint(1, 3)]
+            for name in random.choices(names, k=options['queries'])
+        ]
+        limit = options['limit']
+        ingredient_index.search('')
+        index_ms = self.measure(
+            lambda prefix: ingredient_index.search(prefix, limit), prefixes)
+        orm_ms = self.measure(
+            lambda prefix: list(Ingredient.objects.filter(
+                name__istartswith=prefix)[:limit]),
+            prefixes
+        )
+        self.stdout.write(
+            f'Ингредиентов: {len(names)}, запросов: {len(prefixes)}\n'
+            f'Индекс: {index_ms:.3f} мс на запрос\n'
+            f'ORM: {orm_ms:.3f} мс на запрос'
+        )
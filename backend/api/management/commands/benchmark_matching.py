@@ -0,0 +1,68 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from api.benchmarks import Rollback, create_recipes, measure
+from api.matching import RecipeMatcher
+from recipes.models import Ingredient, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает подбор рецептов по ингредиентам через индекс и через '
+        'ORM на синтетических рецептах, после замера они удаляются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', default=100000, type=int)
+        parser.add_argument('--queries', default=100, type=int)
+        parser.add_argument('--ingredients', default=8, type=int)
+        parser.add_argument('--limit', default=20, type=int)
+
+    def match_orm(self, ingredient_ids, limit):
+        return list(Recipe.objects.annotate(
+            matched=Count(
+                'recipe_ingredients',
+                filter=Q(recipe_ingredients__ingredient__in=ingredient_ids)
+            ),
+            missing=Count('recipe_ingredients') - F('matched')
+        ).filter(matched__gt=0).order_by(
+            'missing', 'cooking_time', 'pk'
+        ).values_list('pk', 'missing')[:limit])
+
+    def handle(self, *args, **options):
+        ingredients = list(Ingredient.objects.all()[:300])
+        if len(ingredients) < max(12, options['ingredients']):
+            raise CommandError('В базе нет ингредиентов, выполните load_to_db')
+        queries = [
+            {ingredient.pk for ingredient in random.sample(
+                ingredients, options['ingredients'])}
+            for _ in range(options['queries'])
+        ]
+        limit = options['limit']
+        matcher = RecipeMatcher()
+        try:
+            with transaction.atomic():
+                create_recipes(options['recipes'], ingredients)
+                start = time.perf_counter()
+                matcher.match(queries[0], limit)
+                built_s = time.perf_counter() - start
+                index_ms = measure(
+                    lambda query: matcher.match(query, limit), queries)
+                orm_ms = measure(
+                    lambda query: self.match_orm(query, limit), queries)
+                if matcher.match(queries[0], limit) != self.match_orm(
+                        queries[0], limit):
+                    raise CommandError('Результаты индекса и ORM расходятся')
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(
+            f'Рецептов: {options["recipes"]}, запросов: {len(queries)}\n'
+            f'Построение индекса: {built_s:.1f} с\n'
+            f'Индекс: {index_ms:.3f} мс на запрос\n'
+            f'ORM: {orm_ms:.3f} мс на запрос'
+        )
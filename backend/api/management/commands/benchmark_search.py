@@ -0,0 +1,60 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from api.benchmarks import WORDS, Rollback, create_recipes, measure
+from recipes.models import Ingredient, Recipe
+from recipes.search import search_recipes, update_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает полнотекстовый поиск рецептов с поиском через icontains '
+        'на синтетических рецептах, после замера они удаляются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', default=100000, type=int)
+        parser.add_argument('--queries', default=200, type=int)
+
+    def handle(self, *args, **options):
+        ingredients = list(Ingredient.objects.all()[:1000])
+        if len(ingredients) < 12:
+            raise CommandError('В базе нет ингредиентов, выполните load_to_db')
+        queries = [
+            random.choice((random.choice(WORDS), ingredient.name))
+            for ingredient in random.choices(ingredients, k=options['queries'])
+        ]
+        try:
+            with transaction.atomic():
+                start = time.perf_counter()
+                create_recipes(options['recipes'], ingredients)
+                created_s = time.perf_counter() - start
+                start = time.perf_counter()
+                update_search_index()
+                indexed_s = time.perf_counter() - start
+                search_ms = measure(
+                    lambda query: list(search_recipes(
+                        Recipe.objects.all(), query)[:10]),
+                    queries
+                )
+                icontains_ms = measure(
+                    lambda query: list(Recipe.objects.filter(
+                        Q(name__icontains=query)
+                        | Q(text__icontains=query)
+                        | Q(ingredients__name__icontains=query)
+                    ).distinct().order_by('-pub_date')[:10]),
+                    queries
+                )
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(
+            f'Рецептов: {options["recipes"]}, запросов: {len(queries)}\n'
+            f'Создание: {created_s:.1f} с, индексация: {indexed_s:.1f} с\n'
+            f'Полнотекстовый поиск: {search_ms:.3f} мс на запрос\n'
+            f'icontains: {icontains_ms:.3f} мс на запрос'
+        )
@@ -0,0 +1,125 @@
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, setup_test_environment,
+                               teardown_test_environment)
+from rest_framework.authtoken.models import Token
+
+from api.benchmarks import (UNLIMITED_RATE, Rollback, create_recipes,
+                            override_throttle_rates)
+from api.throttling import TokenBucketThrottle
+from api.views import RecipeViewSet
+from recipes.models import Ingredient, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет проверку лимита запросов: время, SQL-запросы, сколько '
+        'запросов подряд проходит; сравнивает добавление в избранное с '
+        'лимитом и без'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checks', default=10000, type=int)
+        parser.add_argument('--iterations', default=100, type=int)
+
+    def measure_check(self, user, checks):
+        """Время одной проверки в микросекундах и число SQL-запросов."""
+        view = SimpleNamespace(
+            action='favorite', throttle_scopes=RecipeViewSet.throttle_scopes)
+        request = SimpleNamespace(user=user, META={'REMOTE_ADDR': '127.0.0.1'})
+        throttle = TokenBucketThrottle()
+        with override_throttle_rates(UNLIMITED_RATE), \
+                CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(checks):
+                throttle.allow_request(request, view)
+            elapsed = time.perf_counter() - start
+        cache.delete(throttle.key)
+        return elapsed / checks * 1e6, len(queries)
+
+    def count_burst(self, user, scope):
+        """Сколько запросов подряд пропускает лимит области."""
+        view = SimpleNamespace(action=scope, throttle_scopes={scope: scope})
+        request = SimpleNamespace(user=user, META={'REMOTE_ADDR': '127.0.0.1'})
+        throttle = TokenBucketThrottle()
+        num_requests, _ = throttle.parse_rate(throttle.THROTTLE_RATES[scope])
+        allowed = 0
+        for _ in range(num_requests * 2):
+            allowed += throttle.allow_request(request, view)
+        cache.delete(throttle.key)
+        return allowed
+
+    def measure_favorite(self, client, recipe, token, rate, iterations):
+        """SQL-запросы и среднее время пары добавление — удаление."""
+        path = f'/api/recipes/{recipe.pk}/favorite/'
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'}
+        queries = set()
+        with override_throttle_rates(rate):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                for method, expected in (('post', 201), ('delete', 204)):
+                    with CaptureQueriesContext(connection) as captured:
+                        response = getattr(client, method)(path, **headers)
+                    if response.status_code != expected:
+                        raise CommandError(
+                            f'{method.upper()} {path}: '
+                            f'{response.status_code} '
+                            f'{response.content.decode()}'
+                        )
+                    queries.add((method, len(captured)))
+            elapsed = time.perf_counter() - start
+        return sorted(queries), elapsed / iterations * 1000
+
+    def handle(self, *args, **options):
+        ingredients = list(Ingredient.objects.all()[:20])
+        if len(ingredients) < 12:
+            raise CommandError('В базе нет ингредиентов, выполните load_to_db')
+        setup_test_environment()
+        try:
+            with transaction.atomic():
+                create_recipes(1, ingredients)
+                recipe = Recipe.objects.get(author__username='benchmark')
+                user = recipe.author
+                token = Token.objects.create(user=user).key
+                check_us, check_queries = self.measure_check(
+                    user, options['checks'])
+                bursts = {
+                    scope: self.count_burst(user, scope)
+                    for scope, rate in settings.REST_FRAMEWORK[
+                        'DEFAULT_THROTTLE_RATES'].items()
+                    if rate
+                }
+                client = Client()
+                measured = {
+                    rate: self.measure_favorite(
+                        client, recipe, token, rate, options['iterations'])
+                    for rate in (None, UNLIMITED_RATE)
+                }
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            teardown_test_environment()
+        self.stdout.write(
+            f'Проверка лимита: {check_us:.1f} мкс, '
+            f'SQL-запросов на {options["checks"]} проверок: {check_queries}'
+        )
+        for scope, allowed in bursts.items():
+            self.stdout.write(f'{scope}: подряд прошло {allowed}')
+        for rate, title in ((None, 'без лимита'),
+                            (UNLIMITED_RATE, 'с лимитом')):
+            queries, pair_ms = measured[rate]
+            counts = ', '.join(
+                f'{method.upper()} {count}' for method, count in queries)
+            self.stdout.write(
+                f'Избранное {title}: SQL-запросов {counts}, '
+                f'{pair_ms:.2f} мс на пару запросов'
+            )
+        if check_queries or measured[None][0] != measured[UNLIMITED_RATE][0]:
+            raise CommandError('Проверка лимита обращается к базе данных')
@@ -0,0 +1,159 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from api.benchmarks import ServerTransport, percentile
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingCartItem)
+from users.models import Follow
+
+User = get_user_model()
+
+PREFIX = 'toggles-'
+EXPECTED = {'POST': {201, 400}, 'DELETE': {204, 400}}
+
+
+class Command(BaseCommand):
+    help = (
+        'Параллельно добавляет и удаляет избранное, список покупок и '
+        'подписку одних и тех же пользователей через gunicorn, затем '
+        'сверяет счётчики и суммы списка покупок'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', default=2, type=int)
+        parser.add_argument('--concurrency', default=16, type=int)
+        parser.add_argument('--requests', default=50, type=int,
+                            help='Запросов на каждый поток')
+        parser.add_argument('--workers', default=4, type=int)
+        parser.add_argument('--seed', default=0, type=int)
+
+    def create_fixtures(self, count):
+        User.objects.filter(username__startswith=PREFIX).delete()
+        author = User.objects.create(
+            username=f'{PREFIX}author', email=f'{PREFIX}author@example.com')
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание',
+            image='recipes/generated.png', cooking_time=10)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=10)
+            for ingredient in Ingredient.objects.order_by('pk')[:3]
+        )
+        users = [
+            User.objects.create(
+                username=f'{PREFIX}{number}',
+                email=f'{PREFIX}{number}@example.com')
+            for number in range(count)
+        ]
+        tokens = [Token.objects.create(user=user).key for user in users]
+        return author, recipe, users, tokens
+
+    def run_clients(self, transport, paths, tokens, options):
+        statuses = Counter()
+        latencies = []
+        unexpected = []
+        lock = threading.Lock()
+
+        def client(number):
+            rng = random.Random(options['seed'] + number)
+            own_latencies = []
+            for _ in range(options['requests']):
+                method = rng.choice(list(EXPECTED))
+                path = rng.choice(paths)
+                start = time.perf_counter()
+                status, body, _ = transport.send(
+                    method, path, token=rng.choice(tokens))
+                own_latencies.append(time.perf_counter() - start)
+                with lock:
+                    statuses[status] += 1
+                    if status not in EXPECTED[method]:
+                        unexpected.append(f'{method} {path}: {status} '
+                                          f'{body[:200].decode()}')
+            with lock:
+                latencies.extend(own_latencies)
+
+        threads = [
+            threading.Thread(target=client, args=(number,))
+            for number in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses, sorted(latencies), unexpected
+
+    def check_state(self, author, recipe, users):
+        """Расхождения счётчиков и сумм списка покупок с самими связями."""
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        expected = {
+            'favorites_count': (
+                recipe.favorites_count,
+                Favorite.objects.filter(recipe=recipe).count()),
+            'in_carts_count': (
+                recipe.in_carts_count,
+                ShoppingCart.objects.filter(recipe=recipe).count()),
+            'followers_count': (
+                author.followers_count,
+                Follow.objects.filter(author=author).count()),
+        }
+        for user in User.objects.filter(pk__in=[user.pk for user in users]):
+            expected[f'{user.username}.following_count'] = (
+                user.following_count,
+                Follow.objects.filter(user=user).count())
+        user_ids = [user.pk for user in users]
+        items = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in ShoppingCartItem.objects.filter(
+                user_id__in=user_ids).values_list(
+                    'user_id', 'ingredient_id', 'total_amount')
+        }
+        expected['shopping_cart_items'] = (
+            items, ShoppingCartItem.objects.calculate(user_ids))
+        return [
+            f'{name}: {actual} вместо {correct}'
+            for name, (actual, correct) in expected.items()
+            if actual != correct
+        ]
+
+    def handle(self, *args, **options):
+        if not Ingredient.objects.exists():
+            raise CommandError('В базе нет ингредиентов, выполните load_to_db')
+        author, recipe, users, tokens = self.create_fixtures(options['users'])
+        paths = [
+            f'/api/recipes/{recipe.pk}/favorite/',
+            f'/api/recipes/{recipe.pk}/shopping_cart/',
+            f'/api/users/{author.pk}/subscribe/',
+        ]
+        try:
+            transport = ServerTransport(options['workers'])
+            try:
+                start = time.perf_counter()
+                statuses, latencies, unexpected = self.run_clients(
+                    transport, paths, tokens, options)
+                elapsed = time.perf_counter() - start
+            finally:
+                transport.close()
+            drifted = self.check_state(author, recipe, users)
+        finally:
+            User.objects.filter(username__startswith=PREFIX).delete()
+        counts = ', '.join(
+            f'{status}: {count}' for status, count in sorted(statuses.items()))
+        self.stdout.write(
+            f'Запросов: {len(latencies)}, {len(latencies) / elapsed:.0f} rps, '
+            f'p50 {percentile(latencies, 0.5) * 1000:.1f} мс, '
+            f'p99 {percentile(latencies, 0.99) * 1000:.1f} мс\n'
+            f'Ответы: {counts}'
+        )
+        for line in unexpected[:10] + drifted:
+            self.stdout.write(line)
+        if unexpected or drifted:
+            raise CommandError(
+                f'Неожиданных ответов: {len(unexpected)}, '
+                f'расхождений: {len(drifted)}')
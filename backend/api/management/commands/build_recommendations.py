@@ -0,0 +1,22 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.recommendations import build_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит матрицу признаков рецептов для похожих и рекомендованных '
+        'рецептов; работающие процессы подхватывают её без перезапуска'
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        manifest = build_index(settings.RECOMMENDATIONS_ROOT)
+        self.stdout.write(
+            f'Сборка {manifest["version"]}: рецептов {manifest["recipes"]}, '
+            f'признаков {manifest["features"]}, '
+            f'{time.perf_counter() - start:.1f} с'
+        )
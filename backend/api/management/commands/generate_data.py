@@ -0,0 +1,221 @@
+import io
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from api.benchmarks import BATCH_SIZE, WORDS
+from api.cache import (POPULARITY_VERSION, RECIPES_VERSION, TAGS_VERSION,
+                       USERS_VERSION, bump_version_on_commit,
+                       get_local_cache_notice)
+from api.matching import reset_matching
+from recipes.images import generate_thumbnails, get_thumbnail_names
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingCartItem, Tag)
+from recipes.search import update_search_index
+from users.models import Follow
+
+User = get_user_model()
+
+IMAGE_NAME = 'recipes/generated.png'
+TAG_COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F9A62B', '#2E86C1')
+
+
+class SkewedSampler:
+    """Выбор с весами по закону Ципфа: вес k-го по популярности — 1/k^s.
+
+    Популярность не связана с порядком создания: объекты перемешиваются.
+    """
+
+    def __init__(self, rng, population, exponent):
+        self.rng = rng
+        self.population = list(population)
+        rng.shuffle(self.population)
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent
+            for rank in range(1, len(self.population) + 1)
+        ))
+
+    def __call__(self, count=1):
+        return self.rng.choices(
+            self.population, cum_weights=self.cum_weights, k=count)
+
+
+def sample_pairs(users, targets, count, exclude_self=False):
+    """Уникальные пары (пользователь, объект) с перекосом по обоим."""
+    pairs = set()
+    attempts = 0
+    while len(pairs) < count and attempts < count * 10:
+        batch = count - len(pairs)
+        attempts += batch
+        for pair in zip(users(batch), targets(batch)):
+            if not exclude_self or pair[0] != pair[1]:
+                pairs.add(pair)
+    return pairs
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт синтетических пользователей, рецепты, избранное, списки '
+        'покупок и подписки с перекосом популярности, как в живой базе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', default=1000, type=int)
+        parser.add_argument('--recipes', default=10000, type=int)
+        parser.add_argument('--favorites', default=50000, type=int)
+        parser.add_argument('--carts', default=5000, type=int)
+        parser.add_argument('--follows', default=10000, type=int)
+        parser.add_argument(
+            '--skew', default=1.1, type=float,
+            help='Показатель распределения Ципфа, 0 — равномерно')
+        parser.add_argument('--days', default=365, type=int)
+        parser.add_argument('--seed', default=0, type=int)
+        parser.add_argument(
+            '--prefix', default='generated-',
+            help='Начало имён созданных пользователей и тегов')
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Удалить данные, созданные раньше с тем же префиксом')
+
+    def create_users(self, rng, prefix, count):
+        password = make_password(prefix)
+        return User.objects.bulk_create(
+            (
+                User(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name=rng.choice(WORDS).capitalize(),
+                    last_name=rng.choice(WORDS).capitalize(),
+                    password=password,
+                ) for number in range(count)
+            ),
+            batch_size=BATCH_SIZE
+        )
+
+    def get_tags(self, prefix):
+        tags = list(Tag.objects.all())
+        if tags:
+            return tags
+        return Tag.objects.bulk_create(
+            Tag(name=f'{prefix}{number}', color=color,
+                slug=f'{prefix}{number}')
+            for number, color in enumerate(TAG_COLORS)
+        )
+
+    def get_image(self):
+        if not default_storage.exists(IMAGE_NAME):
+            buffer = io.BytesIO()
+            Image.new('RGB', (640, 480), '#E26C2D').save(buffer, 'PNG')
+            default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+        return IMAGE_NAME
+
+    def create_recipes(self, rng, options, authors, tags, ingredients):
+        now = timezone.now()
+        image = self.get_image()
+        recipes = []
+        for start in range(0, options['recipes'], BATCH_SIZE):
+            count = min(BATCH_SIZE, options['recipes'] - start)
+            batch = Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name=' '.join(rng.choices(WORDS, k=3)).capitalize(),
+                    text=' '.join(rng.choices(WORDS, k=40)),
+                    image=image,
+                    cooking_time=rng.randint(5, 180),
+                ) for author in authors(count)
+            )
+            # auto_now_add проставляет текущее время, даты публикации
+            # распределяются по периоду отдельно.
+            for recipe in batch:
+                recipe.pub_date = now - timedelta(
+                    seconds=rng.randint(0, options['days'] * 24 * 60 * 60))
+            Recipe.objects.bulk_update(batch, ('pub_date',))
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe=recipe, tag=tag)
+                for recipe in batch
+                for tag in rng.sample(tags, rng.randint(1, min(3, len(tags))))
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient,
+                    amount=rng.randint(1, 500)
+                )
+                for recipe in batch
+                for ingredient in set(ingredients(rng.randint(3, 12)))
+            )
+            recipes += batch
+        return recipes
+
+    def create_pairs(self, model, field, pairs):
+        model.objects.bulk_create(
+            (model(user=user, **{field: target}) for user, target in pairs),
+            batch_size=BATCH_SIZE
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        generated = User.objects.filter(username__startswith=prefix)
+        if options['clear']:
+            generated.delete()
+            Tag.objects.filter(slug__startswith=prefix).delete()
+        elif generated.exists():
+            raise CommandError(
+                f'Пользователи {prefix}* уже есть, используйте --clear '
+                f'или другой --prefix')
+        ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+        if not ingredient_ids:
+            raise CommandError('В базе нет ингредиентов, выполните load_to_db')
+        if options['users'] < 2:
+            raise CommandError('Нужно хотя бы два пользователя')
+        rng = random.Random(options['seed'])
+        skew = options['skew']
+        users = self.create_users(rng, prefix, options['users'])
+        recipes = self.create_recipes(
+            rng, options, SkewedSampler(rng, users, skew),
+            self.get_tags(prefix),
+            SkewedSampler(
+                rng, (Ingredient(pk=pk) for pk in ingredient_ids), skew),
+        )
+        active_users = SkewedSampler(rng, users, skew)
+        popular_recipes = SkewedSampler(rng, recipes, skew)
+        self.create_pairs(Favorite, 'recipe', sample_pairs(
+            active_users, popular_recipes, options['favorites']))
+        self.create_pairs(ShoppingCart, 'recipe', sample_pairs(
+            active_users, popular_recipes, options['carts']))
+        self.create_pairs(Follow, 'author', sample_pairs(
+            active_users, SkewedSampler(rng, users, skew),
+            options['follows'], exclude_self=True))
+        if recipes:
+            # У всех рецептов одно изображение и одни миниатюры.
+            generate_thumbnails(recipes[0])
+            Recipe.objects.filter(pk__in=[
+                recipe.pk for recipe in recipes
+            ]).update(thumbnails=get_thumbnail_names(recipes[0]))
+        call_command('reconcile_counters', stdout=self.stdout)
+        ShoppingCartItem.objects.rebuild([user.pk for user in users])
+        update_search_index([recipe.pk for recipe in recipes])
+        for key in (RECIPES_VERSION, TAGS_VERSION, USERS_VERSION,
+                    POPULARITY_VERSION):
+            bump_version_on_commit(key)
+        transaction.on_commit(reset_matching)
+        self.stdout.write(
+            f'Создано пользователей: {len(users)}, '
+            f'рецептов: {len(recipes)}, '
+            f'избранного: {Favorite.objects.filter(user__in=users).count()}, '
+            f'в списках покупок: '
+            f'{ShoppingCart.objects.filter(user__in=users).count()}, '
+            f'подписок: {Follow.objects.filter(user__in=users).count()}'
+        )
+        if notice := get_local_cache_notice():
+            self.stdout.write(notice)
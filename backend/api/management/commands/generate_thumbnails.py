@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_thumbnails, is_stale
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие миниатюры изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать миниатюры всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        generated = failed = 0
+        for recipe in Recipe.objects.only('image', 'thumbnails').iterator():
+            if not options['all'] and not is_stale(recipe):
+                continue
+            try:
+                generate_thumbnails(recipe)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+            else:
+                generated += 1
+        self.stdout.write(
+            f'Создано миниатюр: {generated}, с ошибками: {failed}')
@@ -0,0 +1,90 @@
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import get_free_port, percentile, start_gunicorn
+
+MODES = {
+    'wsgi': 'False',
+    'asgi': 'True',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест GET-запросов: gunicorn с синхронными воркерами '
+        'против воркеров uvicorn на той же машине и базе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--paths', nargs='+',
+            default=['/api/recipes/', '/api/tags/', '/api/ingredients/'])
+        parser.add_argument('--concurrency', default=32, type=int)
+        parser.add_argument('--duration', default=10, type=float)
+        parser.add_argument('--workers', default=2, type=int)
+        parser.add_argument('--modes', nargs='+', default=list(MODES),
+                            choices=list(MODES))
+
+    def run_clients(self, port, paths, concurrency, duration):
+        latencies = []
+        errors = []
+        deadline = time.monotonic() + duration
+
+        def client(number):
+            own_latencies = []
+            own_errors = 0
+            index = number
+            while time.monotonic() < deadline:
+                url = f'http://127.0.0.1:{port}{paths[index % len(paths)]}'
+                index += 1
+                start = time.perf_counter()
+                try:
+                    with urlopen(url, timeout=30) as response:
+                        response.read()
+                except (HTTPError, OSError):
+                    own_errors += 1
+                    continue
+                own_latencies.append(time.perf_counter() - start)
+            latencies.extend(own_latencies)
+            errors.append(own_errors)
+
+        threads = [
+            threading.Thread(target=client, args=(number,))
+            for number in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(latencies), sum(errors)
+
+    def handle(self, *args, **options):
+        for mode in options['modes']:
+            port = get_free_port()
+            server = start_gunicorn(
+                port, options['workers'], ASYNC_READ_API=MODES[mode])
+            try:
+                for path in options['paths']:
+                    try:
+                        urlopen(f'http://127.0.0.1:{port}{path}').read()
+                    except HTTPError as error:
+                        raise CommandError(f'{mode}: {path} — {error}')
+                latencies, errors = self.run_clients(
+                    port, options['paths'], options['concurrency'],
+                    options['duration']
+                )
+            finally:
+                server.terminate()
+                server.wait()
+            if not latencies:
+                raise CommandError(f'{mode}: ни одного успешного запроса')
+            self.stdout.write(
+                f'{mode}: {len(latencies) / options["duration"]:.0f} rps, '
+                f'p50 {percentile(latencies, 0.5) * 1000:.1f} мс, '
+                f'p99 {percentile(latencies, 0.99) * 1000:.1f} мс, '
+                f'ошибок {errors}'
+            )
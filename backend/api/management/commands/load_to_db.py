@@ -1,33 +1,115 @@
+import csv
 import json
 import os
+import re
+from itertools import islice
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db.utils import IntegrityError
+from django.db import transaction
 
+from api.cache import (INGREDIENTS_VERSION, bump_version_on_commit,
+                       get_local_cache_notice)
 from recipes.models import Ingredient
 
 DATA_ROOT = os.path.join(settings.BASE_DIR, 'static/data')
+WHITESPACE = re.compile(r'\s*')
 
 
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты из JSON или CSV'
 
     def add_arguments(self, parser):
         parser.add_argument('filename', default='ingredients.json', nargs='?',
                             type=str)
+        parser.add_argument('--batch-size', default=1000, type=int)
+
+    @staticmethod
+    def read_json(file, chunk_size=64 * 1024):
+        """Элементы массива JSON по одному: файл читается частями."""
+        decoder = json.JSONDecoder()
+        buffer, position = '', 0
+        eof = need_more = False
+        # start: ждём '[', first: элемент или ']', value: элемент,
+        # next: ',' или ']'.
+        state = 'start'
+        while state != 'end':
+            if need_more:
+                chunk = file.read(chunk_size)
+                buffer, position = buffer[position:] + chunk, 0
+                eof, need_more = not chunk, False
+            position = WHITESPACE.match(buffer, position).end()
+            if position == len(buffer):
+                if eof:
+                    raise CommandError('Файл JSON обрывается')
+                need_more = True
+                continue
+            char = buffer[position]
+            if state == 'start':
+                if char != '[':
+                    raise CommandError('Ожидается массив JSON')
+                state = 'first'
+            elif char == ']' and state in ('first', 'next'):
+                state = 'end'
+            elif state == 'next':
+                if char != ',':
+                    raise CommandError('Ожидается массив JSON')
+                state = 'value'
+            else:
+                try:
+                    row, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise CommandError('Некорректный элемент в файле JSON')
+                    need_more = True
+                    continue
+                # Значение, упёршееся в конец буфера, может продолжаться
+                # в следующей части файла.
+                if end == len(buffer) and not eof:
+                    need_more = True
+                    continue
+                yield row
+                position, state = end, 'next'
+                continue
+            position += 1
+
+    @staticmethod
+    def read_csv(file):
+        for name, measurement_unit in csv.reader(file):
+            yield {'name': name, 'measurement_unit': measurement_unit}
+
+    def get_reader(self, filename):
+        extension = os.path.splitext(filename)[1].lower()
+        if extension == '.json':
+            return self.read_json
+        if extension == '.csv':
+            return self.read_csv
+        raise CommandError('Поддерживаются только файлы JSON и CSV')
 
     def handle(self, *args, **options):
+        filename = options['filename']
+        if not os.path.isfile(filename):
+            filename = os.path.join(DATA_ROOT, filename)
+        reader = self.get_reader(filename)
+        total = 0
+        before = Ingredient.objects.count()
         try:
-            with open(os.path.join(DATA_ROOT, options['filename']), 'r',
-                      encoding='utf-8') as f:
-                data = json.load(f)
-                for ingredient in data:
-                    try:
-                        Ingredient.objects.create(**ingredient)
-                    except IntegrityError:
-                        print(f'Ингридиет {ingredient["name"]} '
-                              f'{ingredient["measurement_unit"]} '
-                              f'уже есть в базе')
-
+            with open(filename, 'r', encoding='utf-8') as f, \
+                    transaction.atomic():
+                rows = reader(f)
+                while batch := list(islice(rows, options['batch_size'])):
+                    total += len(batch)
+                    Ingredient.objects.bulk_create(
+                        [Ingredient(**row) for row in batch],
+                        ignore_conflicts=True
+                    )
+                bump_version_on_commit(INGREDIENTS_VERSION)
         except FileNotFoundError:
             raise CommandError('Файл отсутствует в директории data')
+        inserted = Ingredient.objects.count() - before
+        self.stdout.write(
+            f'Добавлено ингредиентов: {inserted}, '
+            f'пропущено: {total - inserted}'
+        )
+        if notice := get_local_cache_notice():
+            self.stdout.write(notice)
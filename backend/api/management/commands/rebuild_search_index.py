@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes.search import update_search_index
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковый индекс всех рецептов'
+
+    def handle(self, *args, **options):
+        update_search_index()
+        self.stdout.write('Поисковый индекс пересчитан')
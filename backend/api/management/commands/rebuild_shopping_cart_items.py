@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingCartItem
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает таблицу ингредиентов в списках покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить расхождения, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        expected = ShoppingCartItem.objects.calculate()
+        actual = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in ShoppingCartItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount').iterator()
+        }
+        drifted = {
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        }
+        users = {user_id for user_id, _ in drifted}
+        self.stdout.write(
+            f'Расхождений: {len(drifted)}, пользователей: {len(users)}')
+        if options['check']:
+            if drifted:
+                raise CommandError('Таблица списков покупок расходится')
+            return
+        if users:
+            ShoppingCartItem.objects.rebuild(list(users))
+            self.stdout.write('Списки покупок пересчитаны')
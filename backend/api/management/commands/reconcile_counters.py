@@ -0,0 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.cache import (POPULARITY_VERSION, USERS_VERSION, bump_version,
+                       get_local_cache_notice)
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow
+
+User = get_user_model()
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'followers_count', Follow, 'author'),
+    (User, 'following_count', Follow, 'user'),
+    (User, 'recipes_count', Recipe, 'author'),
+)
+
+
+def count_related(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Сверяет и исправляет счётчики рецептов и пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить расхождения, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        drifted_total = 0
+        for model, counter, related_model, field in COUNTERS:
+            drifted = model.objects.annotate(
+                actual=count_related(related_model, field)
+            ).exclude(**{counter: F('actual')})
+            drifted_count = drifted.count()
+            drifted_total += drifted_count
+            self.stdout.write(
+                f'{model.__name__}.{counter}: расхождений {drifted_count}')
+            if drifted_count and not options['check']:
+                model.objects.filter(
+                    pk__in=drifted.values('pk')
+                ).update(**{counter: count_related(related_model, field)})
+        if options['check'] and drifted_total:
+            raise CommandError('Счётчики расходятся')
+        if drifted_total:
+            # update() не вызывает сигналы: сортировка по популярности и
+            # счётчики в ответах сбрасываются здесь.
+            bump_version(POPULARITY_VERSION)
+            bump_version(USERS_VERSION)
+            if notice := get_local_cache_notice():
+                self.stdout.write(notice)
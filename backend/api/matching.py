@@ -0,0 +1,278 @@
+import heapq
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from api.constants import MATCHING_CHANGE_TIMEOUT, MATCHING_MAX_PENDING
+from recipes.models import Recipe, RecipeIngredient
+
+MATCHING_SEQUENCE = 'recipe-matching-sequence'
+BYTE_BITS = tuple(
+    tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)
+)
+
+
+def matching_change_key(sequence):
+    return f'recipe-matching-change:{sequence}'
+
+
+def get_sequence():
+    # Начальное значение — время в микросекундах: если счётчик вытеснен
+    # или истёк, новый номер уходит далеко вперёд и индексы
+    # перестраиваются.
+    cache.add(
+        MATCHING_SEQUENCE, time.time_ns() // 1000,
+        timeout=settings.CACHE_VERSION_TIMEOUT
+    )
+    return cache.get(MATCHING_SEQUENCE)
+
+
+def log_recipe_change(recipe_id):
+    """Записывает изменённый рецепт в журнал для индексов всех процессов."""
+    get_sequence()
+    try:
+        sequence = cache.incr(MATCHING_SEQUENCE)
+    except ValueError:
+        return
+    cache.set(
+        matching_change_key(sequence), recipe_id,
+        timeout=MATCHING_CHANGE_TIMEOUT
+    )
+
+
+def reset_matching():
+    """Заставляет индексы всех процессов перестроиться с нуля."""
+    cache.delete(MATCHING_SEQUENCE)
+
+
+def to_bitmap(positions, size):
+    data = bytearray((size + 7) // 8)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, 'little')
+
+
+def iter_positions(bitmap):
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for index, byte in enumerate(data):
+        if byte:
+            for bit in BYTE_BITS[byte]:
+                yield index * 8 + bit
+
+
+class MatchingState:
+    """Снимок индекса: рецепт — позиция бита во всех битовых картах."""
+
+    def __init__(self):
+        self.positions = {}
+        self.recipe_ids = []
+        self.cooking_times = []
+        self.ingredients = []
+        self.ingredient_bits = {}
+        self.size_bits = {}
+
+    @classmethod
+    def build(cls, recipes, recipe_ingredients):
+        state = cls()
+        for recipe_id, cooking_time in recipes:
+            state.positions[recipe_id] = len(state.recipe_ids)
+            state.recipe_ids.append(recipe_id)
+            state.cooking_times.append(cooking_time)
+        ingredients = [[] for _ in state.recipe_ids]
+        ingredient_positions = defaultdict(list)
+        for recipe_id, ingredient_id in recipe_ingredients:
+            position = state.positions.get(recipe_id)
+            if position is not None:
+                ingredients[position].append(ingredient_id)
+                ingredient_positions[ingredient_id].append(position)
+        size_positions = defaultdict(list)
+        for position, recipe_ingredient_ids in enumerate(ingredients):
+            size_positions[len(recipe_ingredient_ids)].append(position)
+        count = len(state.recipe_ids)
+        state.ingredients = [tuple(ids) for ids in ingredients]
+        state.ingredient_bits = {
+            ingredient_id: to_bitmap(positions, count)
+            for ingredient_id, positions in ingredient_positions.items()
+        }
+        state.size_bits = {
+            size: to_bitmap(positions, count)
+            for size, positions in size_positions.items()
+        }
+        return state
+
+    def copy(self):
+        state = MatchingState()
+        state.positions = dict(self.positions)
+        state.recipe_ids = list(self.recipe_ids)
+        state.cooking_times = list(self.cooking_times)
+        state.ingredients = list(self.ingredients)
+        state.ingredient_bits = dict(self.ingredient_bits)
+        state.size_bits = dict(self.size_bits)
+        return state
+
+    @property
+    def deleted_count(self):
+        return len(self.recipe_ids) - len(self.positions)
+
+    def _set_bit(self, bitmaps, key, bit):
+        bitmaps[key] = bitmaps.get(key, 0) | bit
+
+    def _clear_bit(self, bitmaps, key, bit):
+        bitmap = bitmaps[key] & ~bit
+        if bitmap:
+            bitmaps[key] = bitmap
+        else:
+            del bitmaps[key]
+
+    def remove(self, recipe_id):
+        position = self.positions.pop(recipe_id, None)
+        if position is None:
+            return
+        bit = 1 << position
+        for ingredient_id in self.ingredients[position]:
+            self._clear_bit(self.ingredient_bits, ingredient_id, bit)
+        self._clear_bit(
+            self.size_bits, len(self.ingredients[position]), bit)
+        self.recipe_ids[position] = None
+        self.ingredients[position] = ()
+
+    def add(self, recipe_id, cooking_time, ingredient_ids):
+        position = len(self.recipe_ids)
+        bit = 1 << position
+        self.positions[recipe_id] = position
+        self.recipe_ids.append(recipe_id)
+        self.cooking_times.append(cooking_time)
+        self.ingredients.append(tuple(ingredient_ids))
+        for ingredient_id in ingredient_ids:
+            self._set_bit(self.ingredient_bits, ingredient_id, bit)
+        self._set_bit(self.size_bits, len(ingredient_ids), bit)
+
+
+class RecipeMatcher:
+    """Подбор рецептов по имеющимся ингредиентам без обращения к базе.
+
+    Для каждого ингредиента хранится битовая карта рецептов, в которых он
+    есть. Число совпавших ингредиентов считается побитовым сложением карт
+    запроса, а рецепты с одинаковым числом недостающих ингредиентов
+    выбираются пересечением с картами рецептов по числу ингредиентов.
+    Индекс строится при первом запросе, а изменённые рецепты
+    подгружаются по журналу изменений в кэше.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sequence = None
+        self._state = None
+
+    def _build(self):
+        return MatchingState.build(
+            Recipe.objects.order_by('cooking_time', 'pk').values_list(
+                'pk', 'cooking_time').iterator(),
+            RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient_id').iterator()
+        )
+
+    def _get_changed(self, sequence):
+        if self._state is None or not (
+                0 <= sequence - self._sequence <= MATCHING_MAX_PENDING):
+            return None
+        keys = [
+            matching_change_key(number)
+            for number in range(self._sequence + 1, sequence + 1)
+        ]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return None
+        return set(changes.values())
+
+    def _apply(self, recipe_ids):
+        state = self._state.copy()
+        recipes = dict(Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('pk', 'cooking_time'))
+        ingredients = defaultdict(list)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+                recipe_id__in=recipes).values_list(
+                'recipe_id', 'ingredient_id'):
+            ingredients[recipe_id].append(ingredient_id)
+        for recipe_id in recipe_ids:
+            state.remove(recipe_id)
+            if recipe_id in recipes:
+                state.add(
+                    recipe_id, recipes[recipe_id], ingredients[recipe_id])
+        return state
+
+    def _get_actual(self):
+        sequence = get_sequence()
+        if sequence == self._sequence:
+            return self._state
+        with self._lock:
+            if sequence != self._sequence:
+                recipe_ids = self._get_changed(sequence)
+                if recipe_ids is None:
+                    state = self._build()
+                else:
+                    state = self._apply(recipe_ids)
+                    if state.deleted_count > len(state.positions):
+                        state = self._build()
+                self._state = state
+                self._sequence = sequence
+        return self._state
+
+    def match(self, ingredient_ids, limit):
+        """Пары (id рецепта, число недостающих ингредиентов).
+
+        Рецепты без единого совпадения не попадают в выдачу, остальные
+        упорядочены по числу недостающих ингредиентов и времени
+        приготовления.
+        """
+        state = self._get_actual()
+        bitmaps = [
+            state.ingredient_bits[ingredient_id]
+            for ingredient_id in set(ingredient_ids)
+            if ingredient_id in state.ingredient_bits
+        ]
+        if not bitmaps:
+            return []
+        matched = 0
+        planes = []
+        for bitmap in bitmaps:
+            matched |= bitmap
+            carry = bitmap
+            for index, plane in enumerate(planes):
+                planes[index], carry = plane ^ carry, plane & carry
+                if not carry:
+                    break
+            if carry:
+                planes.append(carry)
+        exact = {}
+        for count in range(1, min(len(bitmaps), 2 ** len(planes) - 1) + 1):
+            bitmap = matched
+            for index, plane in enumerate(planes):
+                bitmap &= plane if count >> index & 1 else ~plane
+            if bitmap:
+                exact[count] = bitmap
+        result = []
+        for missing in range(max(state.size_bits) + 1):
+            group = 0
+            for count, bitmap in exact.items():
+                group |= bitmap & state.size_bits.get(count + missing, 0)
+            if not group:
+                continue
+            positions = heapq.nsmallest(
+                limit - len(result), iter_positions(group),
+                key=lambda position: (
+                    state.cooking_times[position], state.recipe_ids[position])
+            )
+            result.extend(
+                (state.recipe_ids[position], missing)
+                for position in positions
+            )
+            if len(result) >= limit:
+                break
+        return result
+
+
+recipe_matcher = RecipeMatcher()
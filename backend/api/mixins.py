@@ -0,0 +1,56 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from api.cache import get_versions
+
+
+def get_conditional_headers(versions, etag_parts):
+    """ETag и Last-Modified ответа по версиям данных."""
+    parts = etag_parts + [
+        f'{key}={versions[key]}' for key in sorted(versions)
+    ]
+    etag = quote_etag(hashlib.md5('|'.join(parts).encode()).hexdigest())
+    return etag, max(versions.values()) // 10 ** 9
+
+
+def set_conditional_headers(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+class ConditionalGetMixin:
+    """ETag и Last-Modified для list и retrieve по версиям данных в кэше.
+
+    Если клиент прислал совпадающий If-None-Match или If-Modified-Since,
+    ответ 304 отдаётся без запроса к базе и сериализации.
+    """
+    version_keys = ()
+
+    def get_version_keys(self):
+        return list(self.version_keys)
+
+    def get_etag_parts(self):
+        return [
+            self.request.build_absolute_uri(),
+            self.request.accepted_renderer.format,
+        ]
+
+    def conditional(self, handler, request, *args, **kwargs):
+        etag, last_modified = get_conditional_headers(
+            get_versions(self.get_version_keys()), self.get_etag_parts())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        return set_conditional_headers(response, etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
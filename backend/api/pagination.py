@@ -1,5 +1,164 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from api.cache import feed_version_key, get_versions
+from api.constants import FEED_CACHE_TIMEOUT, FEED_HEAVY_FOLLOWING
 
 
 class Paginator(pagination.PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class KeysetPaginator(pagination.BasePagination):
+    """Выдача по курсору (pub_date, id) от новых к старым.
+
+    Следующая страница выбирается условием по индексу pub_date вместо
+    OFFSET, общее количество не считается.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    max_page_size = 100
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            pub_date, pk = urlsafe_b64decode(
+                encoded.encode()).decode().rsplit('|', 1)
+            pub_date = parse_datetime(pub_date)
+            pk = int(pk)
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, pk
+
+    def encode_cursor(self, instance):
+        return urlsafe_b64encode(
+            f'{instance.pub_date.isoformat()}|{instance.pk}'.encode()
+        ).decode()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-pub_date', '-pk')
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            pub_date, pk = cursor
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk))
+        page = list(queryset[:page_size + 1])
+        self.next_cursor = (
+            self.encode_cursor(page[page_size - 1])
+            if len(page) > page_size else None
+        )
+        return page[:page_size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
+
+
+class RecipePaginator(Paginator):
+    """Постраничная выдача, с параметром cursor — выдача по курсору.
+
+    Курсор идёт только по дате: с поиском по релевантности и другой
+    сортировкой он не сочетается.
+    """
+    keyset_paginator_class = KeysetPaginator
+    keyset_paginator = None
+    keyset_conflicting_params = ('search', 'ordering')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_query_param = self.keyset_paginator_class.cursor_query_param
+        if cursor_query_param in request.query_params:
+            conflicting = [
+                param for param in self.keyset_conflicting_params
+                if request.query_params.get(param)
+            ]
+            if conflicting:
+                raise ValidationError({
+                    cursor_query_param: 'Курсор нельзя сочетать с '
+                    'параметрами: {}.'.format(', '.join(conflicting))
+                })
+            self.keyset_paginator = self.keyset_paginator_class()
+            return self.keyset_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class FeedPaginator(KeysetPaginator):
+    """Лента подписок по курсору.
+
+    Для подписанных на многих авторов страница собирается дольше, и id
+    её рецептов с курсором следующей страницы кэшируются ненадолго.
+    Версия ленты сбрасывается при подписке, отписке и новом рецепте
+    автора из подписок; рецепты по id достаются из базы с флагами.
+    """
+
+    def get_cache_key(self, request):
+        version_key = feed_version_key(request.user.pk)
+        return 'feed:{}:{}:{}:{}'.format(
+            request.user.pk,
+            get_versions([version_key])[version_key],
+            request.query_params.get(self.cursor_query_param, ''),
+            self.get_page_size(request)
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.user.following_count < FEED_HEAVY_FOLLOWING:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        key = self.get_cache_key(request)
+        cached = cache.get(key)
+        if cached is None:
+            page = super().paginate_queryset(queryset, request, view)
+            cache.set(
+                key, ([recipe.pk for recipe in page], self.next_cursor),
+                timeout=FEED_CACHE_TIMEOUT
+            )
+            return page
+        recipe_ids, self.next_cursor = cached
+        recipes = queryset.in_bulk(recipe_ids)
+        return [
+            recipes[recipe_id] for recipe_id in recipe_ids
+            if recipe_id in recipes
+        ]
@@ -0,0 +1,199 @@
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+
+from api.constants import RECOMMENDATION_KEEP_BUILDS, RECOMMENDATION_TAG_WEIGHT
+from recipes.models import Recipe, RecipeIngredient
+
+MANIFEST = 'manifest.json'
+ARRAYS = ('recipe_ids', 'features', 'weights', 'data', 'indices', 'indptr')
+
+
+def get_feature_rows(recipe_ids=None):
+    """Пары (id рецепта, признак): ингредиент — 2·id, тег — 2·id + 1."""
+    ingredients = RecipeIngredient.objects.all()
+    tags = Recipe.tags.through.objects.all()
+    if recipe_ids is not None:
+        ingredients = ingredients.filter(recipe_id__in=recipe_ids)
+        tags = tags.filter(recipe_id__in=recipe_ids)
+    rows = [
+        (recipe_id, ingredient_id * 2)
+        for recipe_id, ingredient_id in ingredients.values_list(
+            'recipe_id', 'ingredient_id').iterator()
+    ]
+    rows += [
+        (recipe_id, tag_id * 2 + 1)
+        for recipe_id, tag_id in tags.values_list(
+            'recipe_id', 'tag_id').iterator()
+    ]
+    return np.array(rows, dtype=np.int64).reshape(-1, 2)
+
+
+def normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1))).ravel()
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def build_index(root):
+    """Строит матрицу признаков рецептов и делает её текущей.
+
+    Строка матрицы — рецепт, столбец — ингредиент или тег с весом IDF,
+    строки нормированы, так что косинусная близость — скалярное
+    произведение. Массивы сохраняются в новый каталог, затем манифест
+    атомарно переключается на него.
+    """
+    rows = get_feature_rows()
+    recipe_ids, recipe_rows = np.unique(rows[:, 0], return_inverse=True)
+    features, columns = np.unique(rows[:, 1], return_inverse=True)
+    counts = np.bincount(columns, minlength=len(features))
+    weights = np.log((1 + len(recipe_ids)) / (1 + counts)) + 1
+    weights[features % 2 == 1] *= RECOMMENDATION_TAG_WEIGHT
+    matrix = sparse.csr_matrix(
+        (weights[columns], (recipe_rows, columns)),
+        shape=(len(recipe_ids), len(features)), dtype=np.float32
+    )
+    matrix = normalize_rows(matrix).tocsr()
+    # Индексы одного типа: иначе SciPy приведёт их при загрузке и
+    # скопирует в память процесса.
+    index_dtype = np.int32 if matrix.nnz < 2 ** 31 else np.int64
+    arrays = {
+        'recipe_ids': recipe_ids,
+        'features': features,
+        'weights': weights.astype(np.float32),
+        'data': matrix.data.astype(np.float32),
+        'indices': matrix.indices.astype(index_dtype),
+        'indptr': matrix.indptr.astype(index_dtype),
+    }
+    root = Path(root)
+    version = f'build-{time.time_ns()}'
+    (root / version).mkdir(parents=True)
+    for name, array in arrays.items():
+        np.save(root / version / f'{name}.npy', array)
+    manifest = {
+        'version': version,
+        'recipes': len(recipe_ids),
+        'features': len(features),
+    }
+    temporary = root / f'{MANIFEST}.{version}'
+    temporary.write_text(json.dumps(manifest))
+    os.replace(temporary, root / MANIFEST)
+    # Воркеры, ещё не перечитавшие манифест, держат открытыми файлы
+    # прошлой сборки, поэтому она остаётся.
+    builds = sorted(path for path in root.glob('build-*') if path.is_dir())
+    for path in builds[:-RECOMMENDATION_KEEP_BUILDS]:
+        shutil.rmtree(path, ignore_errors=True)
+    return manifest
+
+
+class RecommendationIndex:
+    """Матрица признаков, отображённая в память из файлов сборки.
+
+    Страницы файлов общие для всех процессов, открывших их с mmap.
+    """
+
+    def __init__(self, path):
+        arrays = {
+            name: np.load(path / f'{name}.npy', mmap_mode='r')
+            for name in ARRAYS
+        }
+        self.recipe_ids = arrays['recipe_ids']
+        self.features = arrays['features']
+        self.weights = arrays['weights']
+        self.matrix = sparse.csr_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']),
+            shape=(len(self.recipe_ids), len(self.features)), copy=False
+        )
+
+    def get_vector(self, rows):
+        """Сумма нормированных векторов рецептов из пар (рецепт, признак).
+
+        Признаки, которых не было при сборке, пропускаются.
+        """
+        vector = np.zeros(len(self.features), dtype=np.float32)
+        if not len(rows) or not len(self.features):
+            return vector
+        columns = np.searchsorted(self.features, rows[:, 1])
+        known = columns < len(self.features)
+        known[known] = self.features[columns[known]] == rows[known, 1]
+        columns = columns[known]
+        _, recipes = np.unique(rows[known, 0], return_inverse=True)
+        values = self.weights[columns]
+        norms = np.sqrt(np.bincount(recipes, weights=values ** 2))
+        np.add.at(vector, columns, values / norms[recipes])
+        return vector
+
+    def get_rows(self, recipe_ids):
+        recipe_ids = np.asarray(sorted(recipe_ids), dtype=np.int64)
+        rows = np.searchsorted(self.recipe_ids, recipe_ids)
+        rows = rows[rows < len(self.recipe_ids)]
+        return rows[np.isin(self.recipe_ids[rows], recipe_ids)]
+
+    def top(self, vector, limit, exclude_ids=()):
+        """id самых близких к вектору рецептов, без совсем непохожих."""
+        if not vector.any():
+            return []
+        scores = self.matrix @ vector
+        scores[self.get_rows(exclude_ids)] = 0
+        limit = min(limit, len(scores))
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [int(self.recipe_ids[row]) for row in best if scores[row] > 0]
+
+
+class Recommender:
+    """Текущий индекс рекомендаций процесса.
+
+    Перед каждым запросом сверяет манифест: после пересборки индекс
+    подменяется целиком, запросы видят либо старую, либо новую сборку.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._index = None
+
+    def get_index(self):
+        manifest = Path(settings.RECOMMENDATIONS_ROOT) / MANIFEST
+        try:
+            stat = manifest.stat()
+        except FileNotFoundError:
+            return None
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp == self._stamp:
+            return self._index
+        with self._lock:
+            if stamp != self._stamp:
+                version = json.loads(manifest.read_text())['version']
+                self._index = RecommendationIndex(manifest.parent / version)
+                self._stamp = stamp
+        return self._index
+
+    def similar(self, recipe_id, limit):
+        index = self.get_index()
+        if index is None:
+            return []
+        return index.top(
+            index.get_vector(get_feature_rows([recipe_id])), limit,
+            exclude_ids=[recipe_id]
+        )
+
+    def recommended(self, recipe_ids, limit, exclude_ids):
+        """Рецепты, похожие на набор рецептов, например избранное."""
+        index = self.get_index()
+        if index is None:
+            return []
+        return index.top(
+            index.get_vector(get_feature_rows(recipe_ids)), limit,
+            exclude_ids=exclude_ids
+        )
+
+
+recommender = Recommender()
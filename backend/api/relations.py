@@ -0,0 +1,82 @@
+from django.db import connection, models
+from django.db.models.signals import post_delete, post_save
+
+
+def get_instance(model, fields):
+    """Объект связи из объектов или первичных ключей связанных моделей."""
+    instance = model()
+    for name, value in fields.items():
+        if isinstance(value, models.Model):
+            setattr(instance, name, value)
+        else:
+            field = model._meta.get_field(name)
+            setattr(instance, field.attname, field.get_prep_value(value))
+    return instance
+
+
+def get_columns(model, instance, names):
+    """Столбцы полей связи в кавычках и их значения."""
+    fields = [model._meta.get_field(name) for name in names]
+    return (
+        [connection.ops.quote_name(field.column) for field in fields],
+        [getattr(instance, field.attname) for field in fields],
+    )
+
+
+def create_relation(model, **fields):
+    """Добавляет связь одной инструкцией INSERT ... ON CONFLICT DO NOTHING.
+
+    Возвращает созданный объект или None, если связь уже была: между
+    проверкой и вставкой нет окна для параллельного запроса.
+    Обработчики post_save вызываются, как при save().
+    """
+    instance = get_instance(model, fields)
+    columns, values = get_columns(model, instance, fields)
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({", ".join(columns)}) '
+            f'VALUES ({", ".join(["%s"] * len(values))}) '
+            f'ON CONFLICT DO NOTHING '
+            f'RETURNING {connection.ops.quote_name(model._meta.pk.column)}',
+            values
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    instance.pk = row[0]
+    instance._state.adding = False
+    instance._state.db = connection.alias
+    post_save.send(
+        sender=model, instance=instance, created=True, update_fields=None,
+        raw=False, using=connection.alias
+    )
+    return instance
+
+
+def delete_relation(model, **fields):
+    """Удаляет связь одной инструкцией DELETE ... RETURNING.
+
+    Возвращает удалённый объект или None, если связи не было: из
+    параллельных запросов на удаление успешен ровно один.
+    Обработчики post_delete вызываются, как при delete().
+    """
+    instance = get_instance(model, fields)
+    columns, values = get_columns(model, instance, fields)
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} '
+            f'WHERE {" AND ".join(f"{column} = %s" for column in columns)} '
+            f'RETURNING {connection.ops.quote_name(model._meta.pk.column)}',
+            values
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    instance.pk = row[0]
+    post_delete.send(
+        sender=model, instance=instance, using=connection.alias,
+        origin=instance
+    )
+    return instance
@@ -1,21 +1,44 @@
 from django.core.validators import MaxLengthValidator, MinLengthValidator
+from django.db import transaction
+from django.db.models.manager import BaseManager
 from djoser.serializers import UserCreateSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator
-
-from api.constants import AMOUNT_MAX, AMOUNT_MIN
+from rest_framework.settings import api_settings
+
+from api.cache import get_recipe_payloads
+from api.constants import (AMOUNT_MAX, AMOUNT_MIN, LIST_IMAGE_WIDTH,
+                           SHORT_IMAGE_WIDTH)
+from api.fields import LimitedBase64ImageField, ThumbnailField, ThumbnailsField
+from api.relations import create_relation
+from foodgram.middleware import measure
 from recipes.constants import TIME_MAX, TIME_MIN
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingCartItem, Tag)
+from recipes.search import update_search_index
 from users.models import Follow, User
 
 
-class UserSerializer(serializers.ModelSerializer):
+class MeasuredSerializerMixin:
+    """Время serializer.data попадает в Server-Timing как serialize."""
+
+    @property
+    def data(self):
+        with measure('serialize'):
+            return super().data
+
+
+class MeasuredListSerializer(MeasuredSerializerMixin,
+                             serializers.ListSerializer):
+    pass
+
+
+class UserSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = User
+        list_serializer_class = MeasuredListSerializer
         fields = (
             'email',
             'id',
@@ -26,6 +49,8 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, instance):
+        if hasattr(instance, 'is_subscribed'):
+            return instance.is_subscribed
         user = self.context.get('request').user
         return user.is_authenticated and user.follower.filter(
             author=instance).exists()
@@ -44,9 +69,10 @@ class UserCreateCustomSerializer(UserCreateSerializer):
         )
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
+        list_serializer_class = MeasuredListSerializer
         fields = (
             'id',
             'name',
@@ -55,9 +81,11 @@ class TagSerializer(serializers.ModelSerializer):
         )
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(MeasuredSerializerMixin,
+                           serializers.ModelSerializer):
     class Meta:
         model = Ingredient
+        list_serializer_class = MeasuredListSerializer
         fields = (
             'id',
             'name',
@@ -88,7 +116,14 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         )
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(MeasuredListSerializer):
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, BaseManager) else data
+        return get_recipe_payloads(list(recipes), self.child, variant='list')
+
+
+class RecipeSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     ingredients = RecipeIngredientSerializer(
         source='recipe_ingredients',
         required=True,
@@ -99,6 +134,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     author = UserSerializer()
     tags = TagSerializer(many=True)
     image = Base64ImageField(required=True)
+    thumbnails = ThumbnailsField()
 
     class Meta:
         model = Recipe
@@ -111,16 +147,50 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'thumbnails',
             'text',
             'cooking_time',
         )
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        return get_recipe_payloads([instance], self, variant='detail')[0]
+
+    def to_shared_representation(self, instance, variant):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        data = dict(super().to_representation(instance))
+        if variant == 'list':
+            # В списках отдаётся миниатюра, оригинал — на странице рецепта.
+            data['image'] = data['thumbnails'].get(
+                str(LIST_IMAGE_WIDTH), data['image'])
+        return data
+
+    def add_user_flags(self, data, instance):
+        data = dict(data)
+        data['author'] = dict(
+            data['author'],
+            is_subscribed=self.get_author_is_subscribed(instance)
+        )
+        data['is_favorited'] = self.get_is_favorited(instance)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(instance)
+        return data
+
+    def get_author_is_subscribed(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            return instance.author_is_subscribed
+        return self.fields['author'].get_is_subscribed(instance.author)
 
     def get_is_favorited(self, instance):
+        if hasattr(instance, 'is_favorited'):
+            return instance.is_favorited
         request = self.context.get('request')
         return (request.user.is_authenticated and instance.favorites.filter(
             user=request.user).exists())
 
     def get_is_in_shopping_cart(self, instance):
+        if hasattr(instance, 'is_in_shopping_cart'):
+            return instance.is_in_shopping_cart
         request = self.context.get('request')
         return (
             request.user.is_authenticated and instance.shopping_list.filter(
@@ -128,6 +198,15 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
 
+class MatchedRecipeSerializer(RecipeSerializer):
+    """Рецепт с числом ингредиентов, которых не хватает пользователю."""
+
+    def add_user_flags(self, data, instance):
+        data = super().add_user_flags(data, instance)
+        data['missing_count'] = instance.missing_count
+        return data
+
+
 class IngredientCreateInRecipeSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField()
     amount = serializers.IntegerField(
@@ -155,7 +234,7 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         many=True,
         write_only=True
     )
-    image = Base64ImageField(
+    image = LimitedBase64ImageField(
         allow_null=True,
         allow_empty_file=True,
         required=True,
@@ -185,53 +264,68 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         )
 
     def validate(self, data):
-        image = data.get('image')
-        if not image:
-            raise serializers.ValidationError('Обязательное поле.')
-
-        ingredients = data.get('ingredients')
-        if not ingredients:
-            raise serializers.ValidationError(
-                {'ingredients': 'Добавьте ингредиенты.'}
-            )
+        # При частичном обновлении проверяются только переданные поля,
+        # остальные остаются как есть.
+        if not self.partial or 'image' in data:
+            if not data.get('image'):
+                raise serializers.ValidationError('Обязательное поле.')
+
+        if not self.partial or 'ingredients' in data:
+            ingredients = data.get('ingredients')
+            if not ingredients:
+                raise serializers.ValidationError(
+                    {'ingredients': 'Добавьте ингредиенты.'}
+                )
+            self.validate_ingredient_ids(ingredients)
 
-        tags = data.get('tags')
-        if not tags:
-            raise serializers.ValidationError(
-                {'tags': 'Добавьте хотя бы один тег.'}
-            )
+        if not self.partial or 'tags' in data:
+            tags = data.get('tags')
+            if not tags:
+                raise serializers.ValidationError(
+                    {'tags': 'Добавьте хотя бы один тег.'}
+                )
+            if len(tags) != len(set(tags)):
+                raise serializers.ValidationError(
+                    {'tags': 'Нельзя добавлять одинаковые теги.'}
+                )
+        return super().validate(data)
 
+    @staticmethod
+    def validate_ingredient_ids(ingredients):
+        """Проверяет ингредиенты одним запросом и подставляет объекты."""
         ingredients_count = [ingredient['id'] for ingredient in ingredients]
         if len(ingredients_count) != len(set(ingredients_count)):
             raise serializers.ValidationError(
                 {'ingredients': 'Нельзя добавлять одинаковые ингредиенты.'}
             )
-
-        if len(tags) != len(set(tags)):
-            raise serializers.ValidationError(
-                {'tags': 'Нельзя добавлять одинаковые теги.'}
-            )
-
-        for ingredient_id in ingredients_count:
-            try:
-                Ingredient.objects.get(pk=ingredient_id)
-            except Ingredient.DoesNotExist:
-                raise serializers.ValidationError(
-                    {'ingredients': 'Ингредиент не существует.'})
-        return super().validate(data)
+        existing = Ingredient.objects.in_bulk(ingredients_count)
+        missing = [
+            str(ingredient_id) for ingredient_id in ingredients_count
+            if ingredient_id not in existing
+        ]
+        if missing:
+            raise serializers.ValidationError({
+                'ingredients': 'Ингредиенты не существуют: {}.'.format(
+                    ', '.join(missing))
+            })
+        for ingredient in ingredients:
+            ingredient['ingredient'] = existing[ingredient['id']]
 
     @staticmethod
     def recipe_ingredient_create(ingredients_data, recipe):
+        if not ingredients_data:
+            return
         RecipeIngredient.objects.bulk_create(
             [
                 RecipeIngredient(
-                    ingredient_id=ingredient['id'],
+                    ingredient=ingredient['ingredient'],
                     amount=ingredient['amount'],
                     recipe=recipe
                 ) for ingredient in ingredients_data
             ]
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients_data = validated_data.pop('ingredients')
@@ -240,13 +334,85 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         recipe.tags.set(tags)
         self.recipe_ingredient_create(ingredients_data=ingredients_data,
                                       recipe=recipe)
+        update_search_index([recipe.pk])
         return recipe
 
+    @staticmethod
+    def is_same_image(current, uploaded):
+        try:
+            if uploaded is None or not current or (
+                    current.size != uploaded.size):
+                return False
+            with current.open('rb'):
+                same = current.read() == uploaded.read()
+        except OSError:
+            return False
+        uploaded.seek(0)
+        return same
+
+    def recipe_ingredient_update(self, ingredients_data, recipe):
+        """Обновляет ингредиенты рецепта по разнице со старыми.
+
+        Возвращает старые количества по id ингредиента.
+        """
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipe_ingredients.all()
+        }
+        old_amounts = {
+            ingredient_id: recipe_ingredient.amount
+            for ingredient_id, recipe_ingredient in current.items()
+        }
+        new_amounts = {
+            ingredient['ingredient'].pk: ingredient['amount']
+            for ingredient in ingredients_data
+        }
+        removed = current.keys() - new_amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            recipe_ingredient = current.get(ingredient_id)
+            if recipe_ingredient is not None and (
+                    recipe_ingredient.amount != amount):
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        self.recipe_ingredient_create(
+            [
+                ingredient for ingredient in ingredients_data
+                if ingredient['ingredient'].pk not in current
+            ],
+            recipe
+        )
+        return old_amounts
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('ingredients', None)
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.recipe_ingredient_create(ingredients_data, instance)
-        return super().update(instance, validated_data)
+        if ingredients_data is not None:
+            old_amounts = self.recipe_ingredient_update(
+                ingredients_data, instance)
+            ShoppingCartItem.objects.apply_diff(
+                list(instance.shopping_list.values_list(
+                    'user_id', flat=True)),
+                old_amounts,
+                {
+                    ingredient['ingredient'].pk: ingredient['amount']
+                    for ingredient in ingredients_data
+                }
+            )
+        tags = validated_data.pop('tags', None)
+        if tags is not None and {tag.pk for tag in tags} != set(
+                instance.tags.values_list('pk', flat=True)):
+            instance.tags.set(tags)
+        if self.is_same_image(instance.image, validated_data.get('image')):
+            del validated_data['image']
+        instance = super().update(instance, validated_data)
+        update_search_index([instance.pk])
+        return instance
 
     def to_representation(self, instance):
         request = self.context.get('request')
@@ -254,11 +420,13 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         return RecipeSerializer(instance, context=context).data
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(required=True)
+class RecipeShortSerializer(MeasuredSerializerMixin,
+                            serializers.ModelSerializer):
+    image = ThumbnailField(width=SHORT_IMAGE_WIDTH)
 
     class Meta:
         model = Recipe
+        list_serializer_class = MeasuredListSerializer
         fields = (
             'id',
             'name',
@@ -277,24 +445,31 @@ class FollowSerializer(UserSerializer):
         read_only_fields = ('email', 'username', 'first_name', 'last_name')
 
     def get_recipes(self, instance):
-        request = self.context['request']
-        recipes_limit = request.GET.get('recipes_limit')
-        recipes = instance.recipes.all()
-        try:
-            if recipes_limit:
-                recipes = recipes[:int(recipes_limit)]
-        except ValueError:
-            raise ValueError('Некорректное значение')
+        if hasattr(instance, 'recipes_preview'):
+            recipes = instance.recipes_preview
+        else:
+            request = self.context['request']
+            recipes_limit = request.GET.get('recipes_limit')
+            recipes = instance.recipes.all()
+            try:
+                if recipes_limit:
+                    recipes = recipes[:int(recipes_limit)]
+            except ValueError:
+                raise ValueError('Некорректное значение')
         return RecipeShortSerializer(recipes, many=True).data
 
     def get_recipes_count(self, data):
-        return data.recipes.count()
+        return data.recipes_count
 
 
 class FollowCreateSerializer(serializers.ModelSerializer):
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+
     class Meta:
         model = Follow
         fields = ('user', 'author')
+        # Повторную подписку отсекает вставка в create().
+        validators = ()
 
     def validate(self, data):
         user = data['user']
@@ -303,14 +478,17 @@ class FollowCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Подписаться на себя невозможно.'
             )
-        if Follow.objects.filter(
-                user=user, author=author
-        ).exists():
-            raise serializers.ValidationError(
-                'Повторная подписка на автора невозможна.'
-            )
         return data
 
+    def create(self, validated_data):
+        follow = create_relation(Follow, **validated_data)
+        if follow is None:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    'Повторная подписка на автора невозможна.']
+            })
+        return follow
+
     def to_representation(self, instance):
         return FollowSerializer(
             instance=instance.author,
@@ -318,47 +496,33 @@ class FollowCreateSerializer(serializers.ModelSerializer):
 
 
 class CommonCreateSerializer(serializers.ModelSerializer):
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+
+    def create(self, validated_data):
+        instance = create_relation(self.Meta.model, **validated_data)
+        if instance is None:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    'Такой рецепт уже добавлен.']
+            })
+        return instance
 
     def to_representation(self, instance):
         return RecipeShortSerializer(
             instance.recipe, context=self.context).data
 
-    def validate_unique_together(self, attrs, serializer):
-        queryset = self.Meta.model.objects.all()
-        fields = self.Meta.fields
-        message = self.Meta.message
-        validator = UniqueTogetherValidator(
-            queryset=queryset,
-            fields=fields,
-            message=message
-        )
-        validator.set_context(serializer)
-        validator(attrs)
-
 
 class FavoriteSerializer(CommonCreateSerializer):
     class Meta:
         model = Favorite
         fields = ('user', 'recipe')
-        message = 'Рецепт в избранном.'
-
-    def validate(self, data):
-        user = data['user']
-        recipe = data['recipe']
-        if Favorite.objects.filter(recipe=recipe, user=user).exists():
-            raise serializers.ValidationError('Такой рецепт уже добавлен.')
-        return super().validate(data)
+        # Повторное добавление отсекает вставка в create().
+        validators = ()
 
 
 class ShoppingCartSerializer(CommonCreateSerializer):
     class Meta:
         model = ShoppingCart
         fields = ('user', 'recipe')
-        message = 'Рецепт в списке покупок.'
-
-    def validate(self, data):
-        user = data['user']
-        recipe = data['recipe']
-        if user.shopping_list.filter(recipe=recipe).exists():
-            raise serializers.ValidationError('Такой рецепт уже добавлен.')
-        return super().validate(data)
+        # Повторное добавление отсекает вставка в create().
+        validators = ()
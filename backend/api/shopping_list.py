@@ -0,0 +1,114 @@
+import csv
+import json
+
+from rest_framework import renderers
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ShoppingListRenderer(renderers.BaseRenderer):
+    """Формат выгрузки: сам список отдаётся потоком, ошибки — в JSON."""
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b''
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+
+SHOPPING_LIST_RENDERERS = (
+    TextShoppingListRenderer,
+    CSVShoppingListRenderer,
+    JSONShoppingListRenderer,
+)
+
+
+class ShoppingListNegotiation(DefaultContentNegotiation):
+    """Неподдерживаемый ?format= — 406 со списком форматов, а не 404."""
+
+    def filter_renderers(self, renderers, format):
+        filtered = [
+            renderer for renderer in renderers if renderer.format == format]
+        if not filtered:
+            raise NotAcceptable(
+                'Формат {} не поддерживается, доступны: {}.'.format(
+                    format,
+                    ', '.join(renderer.format for renderer in renderers)
+                )
+            )
+        return filtered
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def export_txt(items):
+    yield 'Список покупок:'
+    for item in items:
+        yield (
+            f"\n{item['ingredient__name']}: {item['amount_of_item']}, "
+            f"{item['ingredient__measurement_unit']}"
+        )
+
+
+def export_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for item in items:
+        yield writer.writerow((
+            item['ingredient__name'],
+            item['amount_of_item'],
+            item['ingredient__measurement_unit'],
+        ))
+
+
+def export_json(items):
+    separator = '['
+    for item in items:
+        yield separator + json.dumps({
+            'name': item['ingredient__name'],
+            'amount': item['amount_of_item'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+EXPORTERS = {
+    'txt': export_txt,
+    'csv': export_csv,
+    'json': export_json,
+}
+
+
+def stream_shopping_list(items, export_format):
+    """Кодированные куски файла не больше CHUNK_SIZE байт."""
+    buffer = []
+    size = 0
+    for part in EXPORTERS[export_format](items):
+        part = part.encode(ShoppingListRenderer.charset)
+        buffer.append(part)
+        size += len(part)
+        if size >= CHUNK_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
@@ -0,0 +1,173 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from api.cache import (INGREDIENTS_VERSION, POPULARITY_VERSION,
+                       RECIPES_VERSION, TAGS_VERSION, USERS_VERSION,
+                       bump_version_on_commit, bump_versions, feed_version_key,
+                       recipe_version_key, user_flags_version_key,
+                       user_version_key)
+from api.constants import FEED_HEAVY_FOLLOWING
+from api.matching import log_recipe_change
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Follow
+
+User = get_user_model()
+
+# Модель связи: счётчики, которые она меняет, — (модель, поле связи,
+# счётчик).
+COUNTERS = {
+    Favorite: ((Recipe, 'recipe_id', 'favorites_count'),),
+    ShoppingCart: ((Recipe, 'recipe_id', 'in_carts_count'),),
+    Follow: (
+        (User, 'author_id', 'followers_count'),
+        (User, 'user_id', 'following_count'),
+    ),
+    Recipe: ((User, 'author_id', 'recipes_count'),),
+}
+
+
+def update_counter(model, pk, counter, delta):
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{counter}__gte': -delta})
+    queryset.update(**{counter: F(counter) + delta})
+
+
+def update_counters(sender, instance, delta):
+    for model, field, counter in COUNTERS[sender]:
+        update_counter(model, getattr(instance, field), counter, delta)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_save, sender=Recipe)
+def increment_counters(sender, instance, created, raw=False, **kwargs):
+    # Счётчики меняются в транзакции записи, поэтому они верны и при
+    # правке через админку, и при каскадном удалении.
+    if created and not raw:
+        update_counters(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Follow)
+@receiver(post_delete, sender=Recipe)
+def decrement_counters(sender, instance, **kwargs):
+    update_counters(sender, instance, -1)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def invalidate_popularity(sender, **kwargs):
+    bump_version_on_commit(POPULARITY_VERSION)
+
+
+def invalidate_recipes(*recipe_ids):
+    for recipe_id in recipe_ids:
+        bump_version_on_commit(recipe_version_key(recipe_id))
+    bump_version_on_commit(RECIPES_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    invalidate_recipes(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    invalidate_recipes(instance.recipe_id)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def log_matching_change(sender, instance, **kwargs):
+    recipe_id = instance.pk if sender is Recipe else instance.recipe_id
+    transaction.on_commit(lambda: log_recipe_change(recipe_id))
+
+
+def invalidate_follower_feeds(author_id):
+    # Лента кэшируется только у подписанных на многих авторов.
+    bump_versions(
+        feed_version_key(user_id)
+        for user_id in Follow.objects.filter(
+            author=author_id,
+            user__following_count__gte=FEED_HEAVY_FOLLOWING
+        ).values_list('user_id', flat=True).iterator()
+    )
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_feeds(sender, instance, created=True, **kwargs):
+    # Правка рецепта не меняет состав ленты, post_delete — меняет.
+    if created:
+        transaction.on_commit(
+            lambda: invalidate_follower_feeds(instance.author_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipes(instance.pk)
+    elif pk_set:
+        invalidate_recipes(*pk_set)
+    else:
+        bump_version_on_commit(TAGS_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    bump_version_on_commit(TAGS_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    bump_version_on_commit(INGREDIENTS_VERSION)
+
+
+# Поля пользователя, которые попадают в ответы API вместе с рецептами.
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def detect_author_change(sender, instance, update_fields=None, raw=False,
+                         **kwargs):
+    # Вход по токену сохраняет только last_login: кэш рецептов автора и
+    # ETag списков от этого не устаревают.
+    if raw or instance._state.adding:
+        instance._author_changed = True
+    elif update_fields is not None and not set(update_fields) & set(
+            AUTHOR_FIELDS):
+        instance._author_changed = False
+    else:
+        saved = User.objects.filter(pk=instance.pk).values(
+            *AUTHOR_FIELDS).first()
+        instance._author_changed = saved != {
+            field: getattr(instance, field) for field in AUTHOR_FIELDS}
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_author(sender, instance, **kwargs):
+    if getattr(instance, '_author_changed', True):
+        bump_version_on_commit(user_version_key(instance.pk))
+        bump_version_on_commit(USERS_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Follow)
+def invalidate_user_flags(sender, instance, **kwargs):
+    bump_version_on_commit(user_flags_version_key(instance.user_id))
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def invalidate_feed(sender, instance, **kwargs):
+    bump_version_on_commit(feed_version_key(instance.user_id))
@@ -0,0 +1,523 @@
+import base64
+import io
+import json
+import tempfile
+import threading
+import time
+import tracemalloc
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError
+from django.db import connection
+from django.test import (AsyncClient, Client, TestCase, TransactionTestCase,
+                         override_settings)
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.autocomplete import IngredientIndex
+from api.management.commands.load_to_db import Command as LoadToDbCommand
+from api.serializers import TagSerializer
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingCartItem, Tag)
+from users.models import Follow
+
+User = get_user_model()
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAA'
+    'DElEQVR4nGNgYGAAAAAEAAH2FzhVAAAAAElFTkSuQmCC'
+)
+
+
+class APITestCase(TestCase):
+    """Пользователи, теги, ингредиенты и рецепты для тестов API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password')
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password')
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag-{number}')
+            for number in range(2)
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(6)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.token = Token.objects.create(user=self.user).key
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    @classmethod
+    def create_recipes(cls, count, author=None):
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=author or cls.author, name=f'Рецепт {number}',
+                text='Описание', image='recipes/images/test.png',
+                cooking_time=10
+            ) for number in range(count)
+        )
+        for recipe in recipes:
+            recipe.tags.set(cls.tags)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=10)
+            for recipe in recipes
+            for ingredient in cls.ingredients[:3]
+        )
+        return recipes
+
+
+class RecipeListQueriesTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        recipes = self.create_recipes(8)
+        Favorite.objects.create(user=self.user, recipe=recipes[0])
+        ShoppingCart.objects.create(user=self.user, recipe=recipes[1])
+        Follow.objects.create(user=self.user, author=self.author)
+
+    def test_queries_do_not_depend_on_page_size(self):
+        for limit in (2, 6):
+            with self.subTest(limit=limit):
+                cache.clear()
+                with self.assertNumQueries(6):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                results = response.json()['results']
+                self.assertEqual(len(results), limit)
+                self.assertTrue(all(
+                    recipe['author']['is_subscribed'] for recipe in results))
+
+
+class IngredientIndexTest(APITestCase):
+
+    def test_rebuilds_on_version_change(self):
+        index = IngredientIndex()
+        self.assertEqual(
+            index.search('ингредиент 1'), [self.ingredients[1]])
+        version = index._index[0]
+        ingredient = self.ingredients[1]
+        ingredient.name = 'Абрикос'
+        ingredient.save()
+        self.assertEqual(index.search('абр'), [ingredient])
+        self.assertEqual(index.search('ингредиент 1'), [])
+        self.assertNotEqual(index._index[0], version)
+        self.assertEqual(len(index._index[1]), len(index._index[2]))
+
+
+class KeysetPaginationTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_recipes(3)
+
+    def test_cursor_rejects_other_orderings(self):
+        for params, status in (
+            ({'cursor': ''}, 200),
+            ({'cursor': '', 'search': ''}, 200),
+            ({'cursor': '', 'search': 'Рецепт'}, 400),
+            ({'cursor': '', 'ordering': 'popular'}, 400),
+            ({'search': 'Рецепт', 'ordering': 'popular'}, 200),
+        ):
+            with self.subTest(params=params):
+                response = self.client.get('/api/recipes/', params)
+                self.assertEqual(response.status_code, status)
+                if status == 400:
+                    self.assertIn('cursor', response.json())
+
+
+class CacheVersionTest(APITestCase):
+
+    def test_local_cache_versions_expire(self):
+        response = self.client.get('/api/tags/')
+        etag = response['ETag']
+        # update() не вызывает сигналы, как изменение из другого процесса
+        # при кэше в памяти процесса.
+        Tag.objects.filter(pk=self.tags[0].pk).update(name='Новый тег')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        expired = time.time() + settings.CACHE_VERSION_TIMEOUT + 1
+        with mock.patch('time.time', return_value=expired):
+            response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Новый тег', [tag['name'] for tag in response.json()])
+
+
+class AuthorVersionTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_recipes(2)
+
+    def get_recipes(self, etag):
+        return self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+
+    def test_login_keeps_recipe_etag(self):
+        etag = self.client.get('/api/recipes/')['ETag']
+        response = APIClient().post('/api/auth/token/login/', {
+            'email': 'author@example.com', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        self.author.refresh_from_db()
+        self.assertIsNotNone(self.author.last_login)
+        self.assertEqual(self.get_recipes(etag).status_code, 304)
+        self.author.first_name = 'Новое имя'
+        self.author.save()
+        self.assertEqual(self.get_recipes(etag).status_code, 200)
+
+
+class ShoppingListExportTest(APITestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.list_ingredients = Ingredient.objects.bulk_create(
+            Ingredient(
+                name=f'Ингредиент для списка покупок номер {number:06}',
+                measurement_unit='г'
+            ) for number in range(40000)
+        )
+
+    def create_items(self, count):
+        ShoppingCartItem.objects.filter(user=self.user).delete()
+        ShoppingCartItem.objects.bulk_create(
+            ShoppingCartItem(
+                user=self.user, ingredient=ingredient, total_amount=100)
+            for ingredient in self.list_ingredients[:count]
+        )
+
+    def measure_peak(self):
+        """Пиковое выделение памяти на запрос и размер выгрузки."""
+        tracemalloc.start()
+        try:
+            response = self.client.get(self.url, {'format': 'csv'})
+            size = sum(len(chunk) for chunk in response.streaming_content)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return peak, size
+
+    def test_peak_memory_does_not_grow_with_list(self):
+        self.create_items(2000)
+        small_peak, small_size = self.measure_peak()
+        self.create_items(40000)
+        large_peak, large_size = self.measure_peak()
+        self.assertGreater(large_size, small_size * 15)
+        self.assertLess(large_peak, large_size / 2)
+        self.assertLess(large_peak, small_peak * 2)
+
+    def test_errors_are_json(self):
+        for params, client, status in (
+            ({'format': 'pdf'}, self.client, 406),
+            ({'format': 'csv'}, APIClient(), 401),
+        ):
+            with self.subTest(params=params, status=status):
+                response = client.get(self.url, params)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertIn('detail', response.json())
+
+
+class LoadToDbTest(TestCase):
+
+    def test_read_json_by_chunks(self):
+        rows = [
+            {'name': f'Ингредиент {number}', 'measurement_unit': 'г'}
+            for number in range(50)
+        ]
+        text = json.dumps(rows, ensure_ascii=False, indent=2)
+        for chunk_size in (1, 7, 64 * 1024):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(LoadToDbCommand.read_json(
+                    io.StringIO(text), chunk_size)), rows)
+        self.assertEqual(
+            list(LoadToDbCommand.read_json(io.StringIO(' [ ] '), 1)), [])
+
+    def test_read_json_rejects_broken_files(self):
+        for text in ('', '{}', '[1 2]', '[1,]', '[{"name": "соль"}'):
+            with self.subTest(text=text), self.assertRaises(CommandError):
+                list(LoadToDbCommand.read_json(io.StringIO(text), 2))
+
+
+class AdminChangelistQueriesTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password')
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def test_queries_do_not_depend_on_rows(self):
+        for count in (2, 6):
+            authors = User.objects.bulk_create(
+                User(username=f'author-{count}-{number}',
+                     email=f'author-{count}-{number}@example.com')
+                for number in range(count)
+            )
+            for author in authors:
+                recipe, = self.create_recipes(1, author)
+                Favorite.objects.create(user=self.user, recipe=recipe)
+                Follow.objects.create(user=self.user, author=author)
+            for url, queries in (
+                ('/admin/recipes/recipe/', 9),
+                ('/admin/users/user/', 7),
+            ):
+                with self.subTest(url=url, count=count), \
+                        self.assertNumQueries(queries):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+
+class CountersTest(APITestCase):
+
+    def assertCounters(self, recipe, **counters):
+        recipe.refresh_from_db()
+        recipe.author.refresh_from_db()
+        self.assertEqual({
+            'favorites_count': recipe.favorites_count,
+            'in_carts_count': recipe.in_carts_count,
+            'recipes_count': recipe.author.recipes_count,
+            'followers_count': recipe.author.followers_count,
+        }, counters)
+
+    def test_counters_follow_orm_and_cascade_changes(self):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            image='recipes/images/test.png', cooking_time=10)
+        self.assertCounters(recipe, favorites_count=0, in_carts_count=0,
+                            recipes_count=1, followers_count=0)
+        response = self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        follower = User.objects.create_user(
+            username='follower', email='follower@example.com')
+        # Связи, добавленные в обход API, как в админке.
+        Favorite.objects.create(user=follower, recipe=recipe)
+        ShoppingCart.objects.create(user=follower, recipe=recipe)
+        Follow.objects.create(user=follower, author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 1)
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.json()['results'][0]['recipes_count'], 1)
+        self.assertCounters(recipe, favorites_count=2, in_carts_count=1,
+                            recipes_count=1, followers_count=2)
+        follower.delete()
+        self.assertCounters(recipe, favorites_count=1, in_carts_count=0,
+                            recipes_count=1, followers_count=1)
+        recipe.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeWriteQueriesTest(APITestCase):
+
+    def get_data(self, count, amount=10):
+        return {
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient in self.ingredients[:count]
+            ],
+            'tags': [tag.pk for tag in self.tags],
+            'image': IMAGE,
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+
+    def test_queries_do_not_depend_on_ingredients(self):
+        for count in (2, 6):
+            with self.subTest(count=count):
+                with self.assertNumQueries(23):
+                    response = self.client.post(
+                        '/api/recipes/', self.get_data(count), format='json')
+                self.assertEqual(response.status_code, 201)
+                url = f'/api/recipes/{response.json()["id"]}/'
+                with self.assertNumQueries(17):
+                    response = self.client.patch(
+                        url, self.get_data(count, amount=20), format='json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    [ingredient['amount']
+                     for ingredient in response.json()['ingredients']],
+                    [20] * count)
+
+
+class RecipePartialUpdateTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.recipe, = self.create_recipes(1, self.user)
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def test_patch_keeps_missing_fields(self):
+        response = self.client.patch(
+            self.url, {'name': 'Новое название'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Новое название')
+        self.assertEqual(
+            sorted(ingredient['id']
+                   for ingredient in response.json()['ingredients']),
+            [ingredient.pk for ingredient in self.ingredients[:3]])
+        self.assertEqual(self.recipe.tags.count(), len(self.tags))
+
+    def test_patch_validates_passed_fields(self):
+        for data in ({'ingredients': []}, {'tags': []}, {'image': ''}):
+            with self.subTest(data=data):
+                response = self.client.patch(self.url, data, format='json')
+                self.assertEqual(response.status_code, 400)
+
+
+class ServerTimingTest(APITestCase):
+    delay = 0.02
+
+    def slow(self, method):
+        def wrapper(*args, **kwargs):
+            time.sleep(self.delay)
+            return method(*args, **kwargs)
+        return wrapper
+
+    def test_serialize_and_render_are_separate_entries(self):
+        with mock.patch.object(
+            TagSerializer, 'to_representation',
+            self.slow(TagSerializer.to_representation)
+        ), mock.patch.object(
+            JSONRenderer, 'render', self.slow(JSONRenderer.render)
+        ):
+            response = self.client.get('/api/tags/')
+        timings = {
+            name: float(params.split('=')[1])
+            for name, params, *_ in (
+                entry.split(';') for entry in
+                response['Server-Timing'].split(', '))
+        }
+        self.assertEqual(
+            list(timings), ['db', 'app', 'serialize', 'render', 'total'])
+        delay = self.delay * 1000
+        self.assertGreaterEqual(timings['serialize'], delay * len(self.tags))
+        self.assertGreaterEqual(timings['render'], delay)
+        self.assertLess(timings['app'], delay)
+
+
+class AsyncHandlerTest(APITestCase):
+
+    async def test_drf_views_under_asgi(self):
+        client = AsyncClient(HTTP_AUTHORIZATION=f'Token {self.token}')
+        for url in ('/api/tags/', '/api/users/', '/api/recipes/'):
+            with self.subTest(url=url):
+                response = await client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('render;dur=', response['Server-Timing'])
+
+
+class MetricsAccessTest(APITestCase):
+    url = '/api/_metrics'
+
+    def test_closed_without_token(self):
+        self.assertEqual(settings.METRICS_TOKEN, '')
+        self.assertEqual(Client().get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password')
+        client = Client()
+        client.force_login(admin)
+        self.assertEqual(client.get(self.url).status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        for authorization, status in (
+            ('', 403), ('Bearer wrong', 403), ('Bearer secret', 200)
+        ):
+            with self.subTest(authorization=authorization):
+                response = Client().get(
+                    self.url, HTTP_AUTHORIZATION=authorization)
+                self.assertEqual(response.status_code, status)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ToggleConcurrencyTest(TransactionTestCase):
+    threads = 8
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # Общая база SQLite в памяти не ждёт блокировку, а сразу
+            # отвечает ошибкой на параллельную запись.
+            self.skipTest('Нужна PostgreSQL или SQLite в файле')
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com')
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com')
+        self.token = Token.objects.create(user=self.user).key
+        self.recipe = Recipe(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10)
+        self.recipe.image.save(
+            'test.png', ContentFile(base64.b64decode(IMAGE.split(',')[1])))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=self.recipe, ingredient=ingredient,
+                             amount=10)
+            for ingredient in Ingredient.objects.bulk_create(
+                Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+                for number in range(3)
+            )
+        )
+
+    def send_together(self, method, url):
+        """Один и тот же запрос из нескольких потоков одновременно."""
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def send():
+            client = APIClient(raise_request_exception=False)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+            try:
+                barrier.wait()
+                statuses.append(getattr(client, method)(url).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=send) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def test_concurrent_toggles(self):
+        for url, count in (
+            (f'/api/recipes/{self.recipe.pk}/favorite/',
+             lambda: self.recipe.favorites_count),
+            (f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+             lambda: self.recipe.in_carts_count),
+            (f'/api/users/{self.author.pk}/subscribe/',
+             lambda: self.author.followers_count),
+        ):
+            for method, status, expected in (
+                ('post', 201, 1), ('delete', 204, 0)
+            ):
+                with self.subTest(url=url, method=method):
+                    self.assertEqual(
+                        self.send_together(method, url),
+                        [status] + [400] * (self.threads - 1))
+                    self.recipe.refresh_from_db()
+                    self.author.refresh_from_db()
+                    self.assertEqual(count(), expected)
+                    self.assertEqual(
+                        ShoppingCartItem.objects.filter(
+                            user=self.user).count(),
+                        3 if 'shopping_cart' in url and expected else 0)
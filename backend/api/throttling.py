@@ -0,0 +1,53 @@
+import math
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import ScopedRateThrottle
+
+
+class TokenBucketThrottle(ScopedRateThrottle):
+    """Лимит запросов по корзине токенов для отдельных действий.
+
+    Область берётся из словаря throttle_scopes представления по имени
+    действия, лимит — из DEFAULT_THROTTLE_RATES. При лимите N/период
+    подряд проходят N запросов, дальше — по одному за период/N.
+    Ключ — пользователь, для анонимов — IP. Состояние корзины — одно
+    значение в кэше, база данных не читается. Чтение и запись кэша не
+    атомарны: одновременные запросы могут пройти сверх лимита на
+    число параллельных запросов.
+    """
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    @property
+    def THROTTLE_RATES(self):
+        # Лимиты читаются при запросе, а не при импорте: так их можно
+        # поменять через override_settings.
+        return api_settings.DEFAULT_THROTTLE_RATES
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scopes', {}).get(
+            getattr(view, 'action', None))
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        refill = self.num_requests / self.duration
+        now = self.timer()
+        tokens, updated = self.cache.get(self.key, (self.num_requests, now))
+        tokens = min(self.num_requests, tokens + (now - updated) * refill)
+        if tokens < 1:
+            self.wait_time = (1 - tokens) / refill
+            return False
+        tokens -= 1
+        # Когда корзина наполнится, ключ не нужен: его отсутствие и есть
+        # полная корзина.
+        self.cache.set(
+            self.key, (tokens, now),
+            math.ceil((self.num_requests - tokens) / refill)
+        )
+        return True
+
+    def wait(self):
+        return self.wait_time
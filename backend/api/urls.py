@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from api import async_views
 from api.views import (IngredientViewSet, RecipeViewSet, TagViewSet,
                        UserCustomViewSet)
+from foodgram.metrics import metrics_view
 
 app_name = 'api'
 
@@ -16,4 +19,18 @@ router.register('tags', TagViewSet, basename='tags')
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('_metrics', metrics_view, name='metrics'),
 ]
+
+if settings.ASYNC_READ_API:
+    urlpatterns = [
+        path('recipes/', async_views.recipe_list, name='recipes-list'),
+        path('recipes/<int:pk>/', async_views.recipe_detail,
+             name='recipes-detail'),
+        path('tags/', async_views.tag_list, name='tags-list'),
+        path('tags/<int:pk>/', async_views.tag_detail, name='tags-detail'),
+        path('ingredients/', async_views.ingredient_list,
+             name='ingredients-list'),
+        path('ingredients/<int:pk>/', async_views.ingredient_detail,
+             name='ingredients-detail'),
+    ] + urlpatterns
@@ -1,33 +1,106 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Sum
-from django.http import FileResponse
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Value, Window
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from api.autocomplete import ingredient_index
+from api.cache import (INGREDIENTS_VERSION, POPULARITY_VERSION,
+                       RECIPES_VERSION, TAGS_VERSION, USERS_VERSION,
+                       user_flags_version_key)
+from api.constants import (FEED_HEAVY_FOLLOWING, MATCH_LIMIT, MATCH_MAX_LIMIT,
+                           RECOMMENDATION_FAVORITES, RECOMMENDATION_MAX_LIMIT,
+                           RECOMMENDED_LIMIT, SIMILAR_LIMIT)
 from api.filters import IngredientFilter, RecipeFilter
-from api.pagination import Paginator
+from api.matching import recipe_matcher
+from api.mixins import ConditionalGetMixin
+from api.pagination import FeedPaginator, Paginator, RecipePaginator
 from api.permissions import IsAuthorOrReadOnly
+from api.recommendations import recommender
+from api.relations import delete_relation
 from api.serializers import (FavoriteSerializer, FollowCreateSerializer,
                              FollowSerializer, IngredientSerializer,
+                             MatchedRecipeSerializer,
                              RecipeCreateUpdateSerializer, RecipeSerializer,
                              ShoppingCartSerializer, TagSerializer,
                              UserSerializer)
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from api.shopping_list import (SHOPPING_LIST_RENDERERS,
+                               ShoppingListNegotiation, stream_shopping_list)
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingCartItem, Tag)
 from users.models import Follow
 
 User = get_user_model()
 
 
+def get_recipe_queryset(user):
+    """Рецепты с флагами избранного, списка покупок и подписки."""
+    queryset = Recipe.objects.select_related('author')
+    if not user.is_authenticated:
+        return queryset.annotate(
+            is_favorited=Value(False),
+            is_in_shopping_cart=Value(False),
+            author_is_subscribed=Value(False)
+        )
+    return queryset.annotate(
+        is_favorited=Exists(Favorite.objects.filter(
+            user=user, recipe=OuterRef('pk'))),
+        is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+            user=user, recipe=OuterRef('pk'))),
+        author_is_subscribed=Exists(Follow.objects.filter(
+            user=user, author=OuterRef('author')))
+    )
+
+
+def get_recipe_version_keys(user, query_params):
+    keys = [RECIPES_VERSION, TAGS_VERSION, INGREDIENTS_VERSION, USERS_VERSION]
+    if user.is_authenticated:
+        keys.append(user_flags_version_key(user.pk))
+    if query_params.get('ordering') == 'popular':
+        keys.append(POPULARITY_VERSION)
+    return keys
+
+
+def get_ingredients(query_params, queryset):
+    """Подсказки по названию из индекса или первые limit ингредиентов."""
+    limit = query_params.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ValidationError({'limit': 'Некорректное значение'})
+    name = query_params.get('name')
+    if name:
+        return ingredient_index.search(name, limit)
+    return list(queryset[:limit])
+
+
+def get_limit(query_params, default, maximum):
+    try:
+        limit = int(query_params.get('limit', default))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= maximum:
+        raise ValidationError({'limit': 'Некорректное значение'})
+    return limit
+
+
 class UserCustomViewSet(UserViewSet):
     queryset = User.objects.all()
     pagination_class = Paginator
     serializer_class = UserSerializer
+    throttle_scopes = {'subscribe': 'subscriptions'}
 
     def get_permissions(self):
         if self.action in ('me', 'subscriptions', 'subscribe'):
@@ -41,10 +114,27 @@ class UserCustomViewSet(UserViewSet):
         url_path='subscriptions',
     )
     def subscriptions(self, request):
+        recipes = Recipe.objects.annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=F('author'),
+                order_by=(F('pub_date').desc(), F('id').desc())
+            )
+        ).order_by('-pub_date')
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit:
+            try:
+                recipes = recipes.filter(row_number__lte=int(recipes_limit))
+            except ValueError:
+                raise ValidationError(
+                    {'recipes_limit': 'Некорректное значение'})
         following_users = User.objects.filter(
             following__user=self.request.user
         ).annotate(
-            recipes_count=Count('recipes'))
+            is_subscribed=Value(True)
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='recipes_preview')
+        ).order_by('-following__id')
         paginated_queryset = self.paginate_queryset(following_users)
         serializer = FollowSerializer(
             paginated_queryset,
@@ -63,36 +153,37 @@ class UserCustomViewSet(UserViewSet):
         serializer_class=FollowSerializer
     )
     def subscribe(self, request, id):
-        get_object_or_404(User, pk=id)
         if request.method == 'POST':
+            get_object_or_404(User, pk=id)
             serializer = FollowCreateSerializer(
-                data={
-                    'user': request.user.id,
-                    'author': id
-                },
+                data={'author': id},
                 context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response(
                 serializer.data, status=status.HTTP_201_CREATED
             )
-        follow_instance = Follow.objects.filter(
-            user=request.user, author=id).first()
-        if follow_instance:
-            follow_instance.delete()
+        with transaction.atomic():
+            deleted = delete_relation(Follow, user=request.user, author=id)
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, pk=id)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    version_keys = (TAGS_VERSION,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = (AllowAny,)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin,
+                        viewsets.ReadOnlyModelViewSet):
+    version_keys = (INGREDIENTS_VERSION,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
@@ -100,14 +191,48 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        return self.conditional(
+            self.list_ingredients, request, *args, **kwargs)
+
+    def list_ingredients(self, request, *args, **kwargs):
+        ingredients = get_ingredients(
+            request.query_params, self.filter_queryset(self.get_queryset()))
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.select_related('author').prefetch_related(
-        'tags', 'ingredients')
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     permission_classes = (IsAuthorOrReadOnly,)
-    pagination_class = Paginator
+    pagination_class = RecipePaginator
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    throttle_scopes = {
+        'create': 'recipes',
+        'favorite': 'favorites',
+        'delete_favorite': 'favorites',
+        'shopping_cart': 'shopping_cart',
+        'delete_shopping_cart': 'shopping_cart',
+    }
+
+    def get_etag_parts(self):
+        return super().get_etag_parts() + [str(self.request.user.pk)]
+
+    def get_queryset(self):
+        return get_recipe_queryset(self.request.user)
+
+    def get_version_keys(self):
+        return get_recipe_version_keys(
+            self.request.user, self.request.query_params)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Список покупок отдаётся потоком, а ошибки его выгрузки — в JSON
+        # при любом запрошенном формате.
+        if (self.action == 'download_shopping_cart'
+                and isinstance(response, Response)):
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
@@ -117,21 +242,19 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @staticmethod
     def add_recipes(request, serializer, pk):
         serializer = serializer(
-            data={'user': request.user.id, 'recipe': pk},
-            context={'request': request})
+            data={'recipe': pk}, context={'request': request})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
     def delete_recipes(request, model, pk):
-        delete_instanse = model.objects.filter(user=request.user,
-                                               recipe=pk).first()
-        if delete_instanse:
-            delete_instanse.delete()
+        with transaction.atomic():
+            deleted = delete_relation(model, user=request.user, recipe=pk)
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
-        if not delete_instanse:
-            delete_instanse = get_object_or_404(model, pk=pk)
+        get_object_or_404(Recipe, pk=pk)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
     @action(
@@ -139,47 +262,152 @@ class RecipeViewSet(viewsets.ModelViewSet):
         methods=['post'],
         permission_classes=[IsAuthenticated])
     def favorite(self, request, pk):
-        return self.add_recipes(request, FavoriteSerializer, pk)
+        return self.add_recipes(
+            request, FavoriteSerializer, pk)
 
     @favorite.mapping.delete
     def delete_favorite(self, request, **kwargs):
-        return self.delete_recipes(request, Favorite, **kwargs)
+        return self.delete_recipes(
+            request, Favorite, **kwargs)
 
     @action(
         methods=['post'],
         detail=True,
         permission_classes=(IsAuthenticated,))
     def shopping_cart(self, request, pk):
-        return self.add_recipes(request, ShoppingCartSerializer, pk)
+        return self.add_recipes(
+            request, ShoppingCartSerializer, pk)
 
     @shopping_cart.mapping.delete
     def delete_shopping_cart(self, request, **kwargs):
-        return self.delete_recipes(request, ShoppingCart, **kwargs)
+        return self.delete_recipes(
+            request, ShoppingCart, **kwargs)
 
-    @staticmethod
-    def creating_shopping_list(ingredients):
-        purchased = ['Список покупок:', ]
-        for item in ingredients:
-            purchased.append(
-                f"{item['ingredient__name']}: {item['amount_of_item']}, "
-                f"{item['ingredient__measurement_unit']}"
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedPaginator
+    )
+    def feed(self, request):
+        """Новые рецепты авторов из подписок пользователя."""
+        follows = Follow.objects.filter(user=request.user)
+        if request.user.following_count >= FEED_HEAVY_FOLLOWING:
+            # Новые рецепты многих авторов плотно идут в общей ленте: обход
+            # индекса pub_date с проверкой подписки быстрее, чем сортировка
+            # всех рецептов этих авторов.
+            queryset = self.get_queryset().filter(
+                Exists(follows.filter(author=OuterRef('author'))))
+        else:
+            queryset = self.get_queryset().filter(
+                author__in=follows.values('author'))
+        serializer = self.get_serializer(
+            self.paginate_queryset(queryset), many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(AllowAny,),
+        pagination_class=None
+    )
+    def match(self, request):
+        """Рецепты по имеющимся ингредиентам: меньше недостающих — выше."""
+        try:
+            ingredient_ids = {
+                int(ingredient_id)
+                for value in request.query_params.getlist('ingredients')
+                for ingredient_id in value.split(',') if ingredient_id
+            }
+        except ValueError:
+            raise ValidationError({'ingredients': 'Некорректное значение'})
+        if not ingredient_ids:
+            raise ValidationError({'ingredients': 'Укажите ингредиенты'})
+        limit = get_limit(request.query_params, MATCH_LIMIT, MATCH_MAX_LIMIT)
+        matches = recipe_matcher.match(ingredient_ids, limit)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in matches])
+        ranked = []
+        for recipe_id, missing_count in matches:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.missing_count = missing_count
+                ranked.append(recipe)
+        serializer = MatchedRecipeSerializer(
+            ranked, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    def get_ranked_response(self, recipe_ids):
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in recipe_ids if pk in recipes], many=True)
+        return Response(serializer.data)
+
+    @action(
+        detail=True,
+        methods=('get',),
+        permission_classes=(AllowAny,),
+        pagination_class=None
+    )
+    def similar(self, request, pk):
+        """Рецепты с похожими ингредиентами и тегами."""
+        recipe = get_object_or_404(Recipe, pk=pk)
+        limit = get_limit(
+            request.query_params, SIMILAR_LIMIT, RECOMMENDATION_MAX_LIMIT)
+        return self.get_ranked_response(
+            recommender.similar(recipe.pk, limit))
+
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(IsAuthenticated,),
+        pagination_class=None
+    )
+    def recommended(self, request):
+        """Рецепты, похожие на избранное пользователя.
+
+        Без избранного или построенной матрицы — популярные рецепты.
+        """
+        limit = get_limit(
+            request.query_params, RECOMMENDED_LIMIT, RECOMMENDATION_MAX_LIMIT)
+        favorites = list(Favorite.objects.filter(
+            user=request.user).order_by('-id').values_list(
+            'recipe_id', flat=True))
+        recipe_ids = []
+        if favorites:
+            recipe_ids = recommender.recommended(
+                favorites[:RECOMMENDATION_FAVORITES], limit,
+                exclude_ids=favorites + list(Recipe.objects.filter(
+                    author=request.user).values_list('pk', flat=True))
             )
-        purchased_file = "\n".join(purchased)
-        return purchased_file
+        if recipe_ids:
+            return self.get_ranked_response(recipe_ids)
+        popular = self.get_queryset().exclude(author=request.user).exclude(
+            pk__in=favorites).order_by('-favorites_count', '-pub_date')
+        serializer = self.get_serializer(popular[:limit], many=True)
+        return Response(serializer.data)
 
     @action(
         detail=False,
         methods=('get',),
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=SHOPPING_LIST_RENDERERS,
+        content_negotiation_class=ShoppingListNegotiation
     )
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_list__user=self.request.user).values(
-            'ingredient__name', 'ingredient__measurement_unit').annotate(
-            amount_of_item=Sum('amount')).order_by('ingredient__name')
-        purchased_list = self.creating_shopping_list(ingredients)
-        response = FileResponse(purchased_list, content_type="text/plain")
+        ingredients = ShoppingCartItem.objects.filter(
+            user=self.request.user).values(
+            'ingredient__name', 'ingredient__measurement_unit',
+            amount_of_item=F('total_amount')).order_by('ingredient__name')
+        export_format = request.accepted_renderer.format
+        response = StreamingHttpResponse(
+            stream_shopping_list(ingredients.iterator(), export_format),
+            content_type=(
+                f'{request.accepted_renderer.media_type}; '
+                f'charset={request.accepted_renderer.charset}'
+            )
+        )
         response['Content-Disposition'] = (
-            'attachment; filename=shopping-list.txt'
+            f'attachment; filename=shopping-list.{export_format}'
         )
         return response
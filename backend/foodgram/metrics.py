@@ -0,0 +1,162 @@
+import hmac
+import os
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class EndpointStats:
+    __slots__ = (
+        'requests', 'over_budget', 'duration_buckets', 'duration_sum',
+        'query_buckets', 'queries_sum', 'db_sum', 'serialize_sum',
+        'render_sum',
+    )
+
+    def __init__(self):
+        self.requests = 0
+        self.over_budget = 0
+        self.duration_buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.duration_sum = 0.0
+        self.query_buckets = [0] * (len(QUERY_BUCKETS) + 1)
+        self.queries_sum = 0
+        self.db_sum = 0.0
+        self.serialize_sum = 0.0
+        self.render_sum = 0.0
+
+
+def escape(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def format_float(value):
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """Метрики запросов по представлениям в памяти процесса.
+
+    Каждый воркер gunicorn считает свои запросы, поэтому в выдаче есть
+    метка pid: Prometheus видит воркеры как отдельные серии.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def observe(self, view, method, total, queries, db_time, serialize_time,
+                render_time, over_budget):
+        with self.lock:
+            stats = self.endpoints.get((view, method))
+            if stats is None:
+                stats = self.endpoints[(view, method)] = EndpointStats()
+            stats.requests += 1
+            stats.over_budget += over_budget
+            stats.duration_buckets[bisect_left(DURATION_BUCKETS, total)] += 1
+            stats.duration_sum += total
+            stats.query_buckets[bisect_left(QUERY_BUCKETS, queries)] += 1
+            stats.queries_sum += queries
+            stats.db_sum += db_time
+            stats.serialize_sum += serialize_time
+            stats.render_sum += render_time
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+
+    def histogram(self, name, labels, buckets, counts, total):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(buckets, counts):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{{{labels},le="{format_float(bound)}"}} '
+                f'{cumulative}'
+            )
+        cumulative += counts[-1]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {format_float(total)}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return lines
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus."""
+        with self.lock:
+            endpoints = sorted(
+                (key, stats) for key, stats in self.endpoints.items())
+            counters = {
+                'requests': [], 'over_budget': [], 'db': [], 'serialize': [],
+                'render': []}
+            durations, queries = [], []
+            for (view, method), stats in endpoints:
+                labels = (f'view="{escape(view)}",method="{method}",'
+                          f'pid="{os.getpid()}"')
+                counters['requests'].append(
+                    f'foodgram_requests_total{{{labels}}} {stats.requests}')
+                counters['over_budget'].append(
+                    f'foodgram_query_budget_exceeded_total{{{labels}}} '
+                    f'{stats.over_budget}')
+                counters['db'].append(
+                    f'foodgram_db_duration_seconds_total{{{labels}}} '
+                    f'{format_float(stats.db_sum)}')
+                counters['serialize'].append(
+                    f'foodgram_serialize_duration_seconds_total{{{labels}}} '
+                    f'{format_float(stats.serialize_sum)}')
+                counters['render'].append(
+                    f'foodgram_render_duration_seconds_total{{{labels}}} '
+                    f'{format_float(stats.render_sum)}')
+                durations += self.histogram(
+                    'foodgram_request_duration_seconds', labels,
+                    DURATION_BUCKETS, stats.duration_buckets,
+                    stats.duration_sum)
+                queries += self.histogram(
+                    'foodgram_request_queries', labels, QUERY_BUCKETS,
+                    stats.query_buckets, stats.queries_sum)
+        families = (
+            ('foodgram_requests_total', 'counter',
+             'Число обработанных запросов.', counters['requests']),
+            ('foodgram_request_duration_seconds', 'histogram',
+             'Время обработки запроса.', durations),
+            ('foodgram_request_queries', 'histogram',
+             'Число SQL-запросов на один запрос.', queries),
+            ('foodgram_db_duration_seconds_total', 'counter',
+             'Время выполнения SQL-запросов.', counters['db']),
+            ('foodgram_serialize_duration_seconds_total', 'counter',
+             'Время сериализации ответа без SQL-запросов.',
+             counters['serialize']),
+            ('foodgram_render_duration_seconds_total', 'counter',
+             'Время отрисовки ответа.', counters['render']),
+            ('foodgram_query_budget_exceeded_total', 'counter',
+             'Запросы, превысившие QUERY_BUDGET.', counters['over_budget']),
+        )
+        lines = []
+        for name, kind, description, samples in families:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines += samples
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def metrics_view(request):
+    """Метрики для Prometheus по токену METRICS_TOKEN.
+
+    Без токена метрики видны только при DEBUG и администраторам.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        allowed = hmac.compare_digest(
+            request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = settings.DEBUG or request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
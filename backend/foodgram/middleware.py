@@ -0,0 +1,180 @@
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from foodgram.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'queries', 'db_time', 'statements',
+                 'serialize_started', 'serialize_time', 'serialize_db_time',
+                 'render_started', 'render_time')
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+        self.serialize_started = None
+        self.serialize_time = 0.0
+        self.serialize_db_time = 0.0
+        self.render_started = None
+        self.render_time = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = perf_counter() - started
+        metrics.db_time += elapsed
+        if metrics.serialize_started is not None:
+            metrics.serialize_db_time += elapsed
+        metrics.queries += 1
+        metrics.statements[sql] += 1
+
+
+@contextmanager
+def measure(stage):
+    """Добавляет время блока к этапу serialize или render запроса.
+
+    Вложенные блоки того же этапа уже входят во внешний.
+    """
+    metrics = current_metrics.get()
+    if metrics is None or getattr(metrics, f'{stage}_started') is not None:
+        yield
+        return
+    started = perf_counter()
+    setattr(metrics, f'{stage}_started', started)
+    try:
+        yield
+    finally:
+        setattr(metrics, f'{stage}_started', None)
+        setattr(metrics, f'{stage}_time', getattr(metrics, f'{stage}_time')
+                + perf_counter() - started)
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+class RequestMetricsMiddleware:
+    """Число и время SQL-запросов, сериализации, отрисовки и всего запроса.
+
+    Считает по представлению и методу, отдаёт в заголовке Server-Timing
+    и в /api/_metrics. Сериализация — serializer.data, отрисовка —
+    перевод данных в JSON; SQL-запросы во время сериализации учитываются
+    только в db. Запросы с числом SQL-запросов больше QUERY_BUDGET
+    попадают в лог вместе с самым частым из них — так видны N+1.
+    Контекст запроса берётся из ContextVar, поэтому учитываются и
+    запросы из sync_to_async в асинхронных представлениях. Потоковые
+    ответы учитываются без времени отдачи тела.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            self.process_template_response = (
+                self.process_template_response_async)
+        connection_created.connect(install_query_recorder)
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        return self.track_render(response)
+
+    async def process_template_response_async(self, request, response):
+        # В асинхронном режиме process_template_response подменён этим
+        # методом, поэтому общая часть вынесена в track_render.
+        return self.track_render(response)
+
+    def track_render(self, response):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.render_started = perf_counter()
+            response.add_post_render_callback(
+                lambda rendered: self.rendered(metrics))
+        return response
+
+    @staticmethod
+    def rendered(metrics):
+        metrics.render_time += perf_counter() - metrics.render_started
+        metrics.render_started = None
+
+    def finish(self, request, response, metrics):
+        total = perf_counter() - metrics.started
+        view = get_view_name(request)
+        budget = settings.QUERY_BUDGET
+        over_budget = metrics.queries > budget
+        if over_budget:
+            statement, repeats = metrics.statements.most_common(1)[0]
+            logger.warning(
+                '%s %s (%s): %d SQL-запросов при бюджете %d, '
+                'чаще всего (%d раз): %s',
+                request.method, request.path, view, metrics.queries,
+                budget, repeats, statement
+            )
+        method = request.method if request.method in METHODS else 'OTHER'
+        serialize_time = metrics.serialize_time - metrics.serialize_db_time
+        registry.observe(
+            view, method, total, metrics.queries, metrics.db_time,
+            serialize_time, metrics.render_time, over_budget
+        )
+        app_time = (total - metrics.db_time - serialize_time
+                    - metrics.render_time)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={metrics.db_time * 1000:.1f};'
+            f'desc="{metrics.queries} queries"',
+            f'app;dur={app_time * 1000:.1f}',
+            f'serialize;dur={serialize_time * 1000:.1f}',
+            f'render;dur={metrics.render_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+        return response
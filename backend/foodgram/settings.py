@@ -33,6 +33,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,6 +63,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+# Асинхронные GET для рецептов, тегов и ингредиентов, запуск через ASGI.
+ASYNC_READ_API = os.getenv('ASYNC_READ_API', 'False').lower() == 'true'
+
 if os.getenv('SQLITE3_DB') is not None:
     DATABASES = {
         'default': {
@@ -77,10 +81,38 @@ else:
             'USER': os.getenv('POSTGRES_USER', 'foodgram_user'),
             'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
             'HOST': os.getenv('DB_HOST', ''),
-            'PORT': os.getenv('DB_PORT', 5432)
+            'PORT': os.getenv('DB_PORT', 5432),
+            # Под ASGI каждый запрос идёт в своём потоке, и постоянные
+            # соединения не переиспользуются, а копятся.
+            'CONN_MAX_AGE': int(os.getenv(
+                'DB_CONN_MAX_AGE', 0 if ASYNC_READ_API else 60)),
+            'CONN_HEALTH_CHECKS': os.getenv(
+                'DB_CONN_HEALTH_CHECKS', 'True').lower() == 'true',
+            # PgBouncer в режиме пула транзакций не сохраняет курсоры
+            # между транзакциями.
+            'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+                'DB_PGBOUNCER', 'False').lower() == 'true',
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 10)),
+                'sslmode': os.getenv('DB_SSLMODE', 'prefer'),
+            },
         }
     }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Время жизни версий данных, по которым строятся ключи кэша ответов и
+# ETag. Кэш в памяти процесса не видит сброс версий в других воркерах и
+# командах manage.py, поэтому там версии истекают и заводятся заново.
+CACHE_VERSION_TIMEOUT = int(os.getenv('CACHE_VERSION_TIMEOUT', 0)) or (
+    60 if CACHES['default']['BACKEND'].endswith('.LocMemCache') else None)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -105,7 +137,19 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
-    'PAGE_SIZE': 6
+    'PAGE_SIZE': 6,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.TokenBucketThrottle',
+    ],
+    # Лимиты действий на запись для пользователя или IP, пустое значение
+    # в переменной окружения снимает лимит.
+    'DEFAULT_THROTTLE_RATES': {
+        'recipes': os.getenv('THROTTLE_RECIPES', '30/hour') or None,
+        'favorites': os.getenv('THROTTLE_FAVORITES', '60/min') or None,
+        'shopping_cart': os.getenv(
+            'THROTTLE_SHOPPING_CART', '60/min') or None,
+        'subscriptions': os.getenv('THROTTLE_SUBSCRIPTIONS', '30/min') or None,
+    },
 }
 
 AUTH_USER_MODEL = "users.User"
@@ -126,6 +170,21 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Изображения рецептов до 10 МБ приходят в JSON строкой base64.
+DATA_UPLOAD_MAX_MEMORY_SIZE = 15 * 1024 * 1024
+
+THUMBNAILS_ASYNC = os.getenv('THUMBNAILS_ASYNC', 'True').lower() == 'true'
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+
+# Матрица для похожих и рекомендованных рецептов, build_recommendations.
+# Не в MEDIA_ROOT: его раздаёт nginx. В контейнере — отдельный том.
+RECOMMENDATIONS_ROOT = os.getenv(
+    'RECOMMENDATIONS_ROOT', BASE_DIR / 'var' / 'recommendations')
+
+# Запросы с большим числом SQL-запросов пишутся в лог как возможные N+1.
+QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', 30))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 DJOSER = {
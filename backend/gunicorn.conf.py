@@ -0,0 +1,10 @@
+import os
+
+bind = '0.0.0.0:8000'
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+
+if os.getenv('ASYNC_READ_API', 'False').lower() == 'true':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram.wsgi'
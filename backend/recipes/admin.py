@@ -1,7 +1,9 @@
 from django.contrib import admin
+from django.db.models import Prefetch
 
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingCartItem, Tag)
+from .search import update_search_index
 
 
 class RecipeIngredientInline(admin.TabularInline):
@@ -19,14 +21,23 @@ class AdminRecipe(admin.ModelAdmin):
     list_filter = ('name', 'author', 'tags')
     exclude = ('ingredients',)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        ShoppingCartItem.objects.rebuild(list(
+            form.instance.shopping_list.values_list('user_id', flat=True)))
+        update_search_index([form.instance.pk])
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'author'
+        ).prefetch_related(
+            Prefetch('ingredients', queryset=Ingredient.objects.only('name'))
+        )
+
     @admin.display(description='Ингредиенты')
     def get_ingredients_display(self, obj):
         return ', '.join(
-            obj.ingredients.all().values_list('name', flat=True))
-
-    @admin.display(description='Добавлено в избранное')
-    def favorites_count(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+            ingredient.name for ingredient in obj.ingredients.all())
 
 
 @admin.register(Tag)
@@ -2,3 +2,7 @@ MAX_LENGTH = 200
 COLOR_MAX_LENGTH = 7
 TIME_MIN = 1
 TIME_MAX = 1440
+SEARCH_CONFIG = 'russian'
+SEARCH_BATCH_SIZE = 500
+THUMBNAIL_WIDTHS = (320, 640)
+THUMBNAIL_QUALITY = 80
@@ -0,0 +1,106 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps, features
+
+from recipes.constants import THUMBNAIL_QUALITY, THUMBNAIL_WIDTHS
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+THUMBNAIL_EXTENSION = THUMBNAIL_FORMAT.lower().replace('jpeg', 'jpg')
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.THUMBNAIL_WORKERS,
+    thread_name_prefix='thumbnails'
+)
+
+
+def get_thumbnail_name(image_name, width):
+    stem = PurePosixPath(image_name).name.replace('.', '-')
+    return f'recipes/thumbnails/{stem}-{width}.{THUMBNAIL_EXTENSION}'
+
+
+def get_thumbnail_names(recipe):
+    return {
+        str(width): get_thumbnail_name(recipe.image.name, width)
+        for width in THUMBNAIL_WIDTHS
+    }
+
+
+def is_stale(recipe):
+    return bool(recipe.image) and (
+        recipe.thumbnails != get_thumbnail_names(recipe))
+
+
+def render_thumbnail(image, width):
+    """Уменьшенная копия без EXIF и прочих метаданных исходника."""
+    thumbnail = image.copy()
+    thumbnail.thumbnail((width, image.height), Image.LANCZOS)
+    thumbnail.info = {}
+    buffer = BytesIO()
+    thumbnail.save(buffer, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+    return buffer.getvalue()
+
+
+def delete_files(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def generate_thumbnails(recipe):
+    """Создаёт миниатюры рецепта и сохраняет ссылки на них."""
+    names = get_thumbnail_names(recipe)
+    with recipe.image.open('rb'), Image.open(recipe.image) as image:
+        image = ImageOps.exif_transpose(image)
+        has_alpha = 'A' in image.getbands() and THUMBNAIL_FORMAT == 'WEBP'
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        for width, name in zip(THUMBNAIL_WIDTHS, names.values()):
+            default_storage.delete(name)
+            default_storage.save(
+                name, ContentFile(render_thumbnail(image, width)))
+    with transaction.atomic():
+        current = Recipe.objects.select_for_update().filter(
+            pk=recipe.pk, image=recipe.image.name).first()
+        if current is None:
+            # Пока создавались миниатюры, изображение заменили.
+            delete_files(names.values())
+            return
+        stale = set(current.thumbnails.values()) - set(names.values())
+        current.thumbnails = names
+        current.save(update_fields=('thumbnails',))
+        transaction.on_commit(lambda: delete_files(stale))
+
+
+def process_thumbnails(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not is_stale(recipe):
+        return
+    try:
+        generate_thumbnails(recipe)
+    except Exception:
+        logger.exception(
+            'Не удалось создать миниатюры рецепта %s', recipe_id)
+
+
+def run_in_worker(recipe_id):
+    try:
+        process_thumbnails(recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_thumbnails(recipe_id):
+    """После коммита ставит создание миниатюр в очередь фоновых потоков."""
+    if settings.THUMBNAILS_ASYNC:
+        transaction.on_commit(
+            lambda: executor.submit(run_in_worker, recipe_id))
+    else:
+        transaction.on_commit(lambda: process_thumbnails(recipe_id))
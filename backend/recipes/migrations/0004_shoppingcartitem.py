@@ -0,0 +1,107 @@
+# Generated by Django 4.2.11 on 2026-10-17 06:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def delete_duplicates(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    max_amount = 32767
+    duplicates = RecipeIngredient.objects.values(
+        'recipe', 'ingredient'
+    ).annotate(
+        keep_id=models.Min('id'), count=models.Count('id'),
+        total=models.Sum('amount')
+    ).filter(count__gt=1).order_by()
+    for group in duplicates:
+        RecipeIngredient.objects.filter(pk=group['keep_id']).update(
+            amount=min(group['total'], max_amount))
+        RecipeIngredient.objects.filter(
+            recipe_id=group['recipe'], ingredient_id=group['ingredient']
+        ).exclude(pk=group['keep_id']).delete()
+    for model_name in ('Favorite', 'ShoppingCart'):
+        model = apps.get_model('recipes', model_name)
+        duplicates = model.objects.values('user', 'recipe').annotate(
+            keep_id=models.Min('id'), count=models.Count('id')
+        ).filter(count__gt=1).order_by()
+        for group in duplicates:
+            model.objects.filter(
+                user_id=group['user'], recipe_id=group['recipe']
+            ).exclude(pk=group['keep_id']).delete()
+
+
+def fill_shopping_cart_items(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingCartItem = apps.get_model('recipes', 'ShoppingCartItem')
+    totals = RecipeIngredient.objects.filter(
+        recipe__shopping_list__isnull=False
+    ).values('recipe__shopping_list__user', 'ingredient').annotate(
+        total_amount=models.Sum('amount')).order_by()
+    ShoppingCartItem.objects.bulk_create(
+        [
+            ShoppingCartItem(
+                user_id=row['recipe__shopping_list__user'],
+                ingredient_id=row['ingredient'],
+                total_amount=row['total_amount']
+            )
+            for row in totals
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0003_alter_favorite_recipe_alter_favorite_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.IntegerField(verbose_name='Общее количество')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в списке покупок',
+                'verbose_name_plural': 'Ингредиенты в списках покупок',
+                'default_related_name': 'shopping_cart_items',
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='shoppingcart',
+            options={'default_related_name': 'shopping_list', 'verbose_name': 'Список покупок', 'verbose_name_plural': 'Списки покупок'},
+        ),
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipeingredient',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredient'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcartitem',
+            name='ingredient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.ingredient', verbose_name='Ингредиент'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcartitem',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_cart_item'),
+        ),
+        migrations.RunPython(
+            fill_shopping_cart_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.11 on 2026-10-17 06:02
+
+from django.db import migrations, models
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingCartItem = apps.get_model('recipes', 'ShoppingCartItem')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        keep_id=models.Min('id'), count=models.Count('id')
+    ).filter(count__gt=1).order_by()
+    for group in duplicates:
+        keep_id = group['keep_id']
+        extra_ids = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(pk=keep_id).values_list('pk', flat=True))
+        # amount — smallint, total_amount — integer.
+        for model, owner, amount, max_amount in (
+            (RecipeIngredient, 'recipe_id', 'amount', 32767),
+            (ShoppingCartItem, 'user_id', 'total_amount', 2147483647),
+        ):
+            for row in model.objects.filter(ingredient_id__in=extra_ids):
+                kept = model.objects.filter(
+                    ingredient_id=keep_id, **{owner: getattr(row, owner)}
+                ).first()
+                if kept is None:
+                    row.ingredient_id = keep_id
+                    row.save(update_fields=['ingredient'])
+                else:
+                    setattr(kept, amount, min(
+                        getattr(kept, amount) + getattr(row, amount),
+                        max_amount))
+                    kept.save(update_fields=[amount])
+                    row.delete()
+        Ingredient.objects.filter(pk__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_shoppingcartitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.11 on 2026-10-17 06:06
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+INGREDIENT_NAMES = (
+    "SELECT {aggregate} FROM recipes_recipeingredient AS recipe_ingredient "
+    "JOIN recipes_ingredient AS ingredient "
+    "ON ingredient.id = recipe_ingredient.ingredient_id "
+    "WHERE recipe_ingredient.recipe_id = recipe.id"
+)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX recipe_search_vector_idx ON recipes_recipe '
+            'USING GIN (search_vector)'
+        )
+        schema_editor.execute(
+            "UPDATE recipes_recipe AS recipe SET search_vector = "
+            "setweight(to_tsvector('russian', recipe.name), 'A') || "
+            "setweight(to_tsvector('russian', COALESCE(({}), '')), 'B') || "
+            "setweight(to_tsvector('russian', recipe.text), 'C')".format(
+                INGREDIENT_NAMES.format(
+                    aggregate="string_agg(ingredient.name, ' ')"))
+        )
+    elif schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE recipes_recipe_fts '
+            'USING fts5(name, text, ingredients)'
+        )
+        schema_editor.execute(
+            'INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients) '
+            'SELECT recipe.id, recipe.name, recipe.text, ({}) '
+            'FROM recipes_recipe AS recipe'.format(INGREDIENT_NAMES.format(
+                aggregate="group_concat(ingredient.name, ' ')"))
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX recipe_search_vector_idx')
+    elif schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE recipes_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-17 06:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='thumbnails',
+            field=models.JSONField(default=dict, editable=False, verbose_name='Миниатюры изображения'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import Case, F, Sum, Value, When
 
 from recipes.constants import COLOR_MAX_LENGTH, MAX_LENGTH, TIME_MAX, TIME_MIN
 
@@ -47,6 +49,12 @@ class Ingredient(models.Model):
         ordering = ['id', ]
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}'
@@ -105,11 +113,41 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True,
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Добавлено в избранное',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Добавлено в списки покупок',
+        default=0,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+    thumbnails = models.JSONField(
+        verbose_name='Миниатюры изображения',
+        default=dict,
+        editable=False,
+    )
 
     class Meta:
         ordering = ['-pub_date', ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=('-favorites_count', '-pub_date'),
+                name='recipe_popularity_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_feed_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}'
@@ -198,3 +236,120 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} - {self.recipe}'
+
+
+class ShoppingCartItemManager(models.Manager):
+
+    def add(self, user_ids, amounts):
+        """Прибавляет количества ингредиентов к спискам покупок."""
+        rows = [
+            (user_id, ingredient_id, amount)
+            for user_id in user_ids
+            for ingredient_id, amount in amounts.items()
+        ]
+        if not rows:
+            return
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        placeholders = ', '.join(['(%s, %s, %s)'] * len(rows))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, ingredient_id, total_amount) '
+                f'VALUES {placeholders} '
+                f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                f'SET total_amount = {table}.total_amount '
+                f'+ EXCLUDED.total_amount',
+                [value for row in rows for value in row]
+            )
+
+    def subtract(self, user_ids, amounts):
+        """Вычитает количества, обнулившиеся строки удаляются."""
+        if not user_ids or not amounts:
+            return
+        items = self.filter(user_id__in=user_ids)
+        items.filter(ingredient_id__in=amounts).update(
+            total_amount=F('total_amount') - Case(
+                *(When(ingredient_id=ingredient_id, then=Value(amount))
+                  for ingredient_id, amount in amounts.items()),
+                output_field=models.IntegerField()
+            )
+        )
+        items.filter(total_amount__lte=0).delete()
+
+    def apply_diff(self, user_ids, old_amounts, new_amounts):
+        added, removed = {}, {}
+        for ingredient_id in old_amounts.keys() | new_amounts.keys():
+            delta = (new_amounts.get(ingredient_id, 0)
+                     - old_amounts.get(ingredient_id, 0))
+            if delta > 0:
+                added[ingredient_id] = delta
+            elif delta < 0:
+                removed[ingredient_id] = -delta
+        self.add(user_ids, added)
+        self.subtract(user_ids, removed)
+
+    def calculate(self, user_ids=None):
+        """Суммы по спискам покупок, посчитанные заново по рецептам."""
+        if user_ids is None:
+            queryset = RecipeIngredient.objects.filter(
+                recipe__shopping_list__isnull=False)
+        else:
+            queryset = RecipeIngredient.objects.filter(
+                recipe__shopping_list__user__in=user_ids)
+        return {
+            (row['recipe__shopping_list__user'], row['ingredient']):
+                row['total_amount']
+            for row in queryset.values(
+                'recipe__shopping_list__user', 'ingredient'
+            ).annotate(total_amount=Sum('amount')).order_by()
+        }
+
+    @transaction.atomic
+    def rebuild(self, user_ids=None):
+        totals = self.calculate(user_ids)
+        items = self.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        items.delete()
+        self.bulk_create(
+            [
+                self.model(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=total_amount
+                )
+                for (user_id, ingredient_id), total_amount in totals.items()
+            ],
+            batch_size=1000
+        )
+
+
+class ShoppingCartItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.IntegerField(
+        verbose_name='Общее количество',
+    )
+
+    objects = ShoppingCartItemManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        default_related_name = 'shopping_cart_items'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_cart_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}: {self.total_amount}'
@@ -0,0 +1,100 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.expressions import RawSQL
+
+from recipes.constants import SEARCH_BATCH_SIZE, SEARCH_CONFIG
+from recipes.models import Recipe, RecipeIngredient
+
+FTS_TABLE = 'recipes_recipe_fts'
+
+
+def get_ingredient_names():
+    return Subquery(
+        RecipeIngredient.objects.filter(recipe=OuterRef('pk')).order_by(
+        ).values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')).values('names')
+    )
+
+
+def batches(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), SEARCH_BATCH_SIZE):
+        yield recipe_ids[start:start + SEARCH_BATCH_SIZE]
+
+
+def update_search_index(recipe_ids=None):
+    """Пересчитывает поисковый индекс рецептов, без ids — всех."""
+    if connection.vendor == 'postgresql':
+        queryset = Recipe.objects.all()
+        if recipe_ids is not None:
+            queryset = queryset.filter(pk__in=recipe_ids)
+        queryset.update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(
+                get_ingredient_names(), weight='B', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+        ))
+        return
+    select = (
+        f'INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients) '
+        f'SELECT recipe.id, recipe.name, recipe.text, ('
+        f'SELECT group_concat(ingredient.name, \' \') '
+        f'FROM recipes_recipeingredient AS recipe_ingredient '
+        f'JOIN recipes_ingredient AS ingredient '
+        f'ON ingredient.id = recipe_ingredient.ingredient_id '
+        f'WHERE recipe_ingredient.recipe_id = recipe.id'
+        f') FROM recipes_recipe AS recipe'
+    )
+    with connection.cursor() as cursor:
+        if recipe_ids is None:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(select)
+            return
+        for batch in batches(recipe_ids):
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+                batch
+            )
+            cursor.execute(
+                f'{select} WHERE recipe.id IN ({placeholders})', batch)
+
+
+def delete_from_search_index(recipe_id):
+    if connection.vendor == 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [recipe_id])
+
+
+def get_fts_query(value):
+    return ' '.join(
+        '"{}"*'.format(word.replace('"', '""')) for word in value.split())
+
+
+def search_recipes(queryset, value):
+    """Рецепты по поисковой строке, от более релевантных к менее."""
+    if not value.split():
+        return queryset
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            value, search_type='websearch', config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-pub_date')
+    query = get_fts_query(value)
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [query]
+    )).annotate(search_rank=RawSQL(
+        # LIMIT во вложенном запросе не даёт SQLite развернуть его во
+        # внешний: MATCH выполняется один раз, а не на каждый рецепт.
+        f'SELECT search_rank FROM ('
+        f'SELECT rowid, -bm25({FTS_TABLE}, 10.0, 1.0, 5.0) AS search_rank '
+        f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT -1'
+        f') AS ranks WHERE ranks.rowid = recipes_recipe.id',
+        [query]
+    )).order_by('-search_rank', '-pub_date')
@@ -0,0 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.images import delete_files, is_stale, schedule_thumbnails
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+                            ShoppingCartItem)
+from recipes.search import delete_from_search_index, update_search_index
+
+User = get_user_model()
+
+
+def get_recipe_amounts(recipe_id):
+    return dict(RecipeIngredient.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount'))
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_cart_items(sender, instance, created, **kwargs):
+    if created:
+        ShoppingCartItem.objects.add(
+            [instance.user_id], get_recipe_amounts(instance.recipe_id))
+
+
+def is_deleted_user(origin, user_id):
+    if isinstance(origin, QuerySet):
+        return origin.model is User and origin.filter(pk=user_id).exists()
+    return isinstance(origin, User) and origin.pk == user_id
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_cart_items(sender, instance, origin=None, **kwargs):
+    origin_model = (
+        origin.model if isinstance(origin, QuerySet) else type(origin))
+    if origin_model is ShoppingCart:
+        ShoppingCartItem.objects.subtract(
+            [instance.user_id], get_recipe_amounts(instance.recipe_id))
+    elif not is_deleted_user(origin, instance.user_id):
+        # Рецепт удалён каскадно, его состав может быть уже удалён.
+        ShoppingCartItem.objects.rebuild([instance.user_id])
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_search_index(sender, instance, **kwargs):
+    delete_from_search_index(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def queue_thumbnails(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if is_stale(instance):
+        schedule_thumbnails(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_thumbnails(sender, instance, **kwargs):
+    names = list(instance.thumbnails.values())
+    transaction.on_commit(lambda: delete_files(names))
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(sender, instance, created, **kwargs):
+    if not created:
+        update_search_index(list(instance.ingredient_recipes.values_list(
+            'recipe_id', flat=True)))
@@ -3,7 +3,6 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group
 
-from recipes.models import Recipe
 from users.models import Follow
 
 User = get_user_model()
@@ -33,13 +32,19 @@ class UserAdmin(UserAdmin):
         'username'
     )
 
-    @admin.display(description='Количество подписчиков')
+    @admin.display(
+        description='Количество подписчиков',
+        ordering='followers_count'
+    )
     def get_follow_count(self, obj):
-        return Follow.objects.filter(user=obj).count()
+        return obj.followers_count
 
-    @admin.display(description='Количество рецептов')
+    @admin.display(
+        description='Количество рецептов',
+        ordering='recipes_count'
+    )
     def get_recipe_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+        return obj.recipes_count
 
 
 admin.site.register(Follow)
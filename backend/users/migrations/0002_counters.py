@@ -0,0 +1,60 @@
+# Generated by Django 4.2.11 on 2026-10-17 06:04
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_related(model, field):
+    return Coalesce(models.Subquery(
+        model.objects.filter(**{field: models.OuterRef('pk')}).order_by(
+        ).values(field).annotate(count=models.Count('pk')).values('count')
+    ), 0)
+
+
+def delete_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('users', 'Follow')
+    duplicates = Follow.objects.values('user', 'author').annotate(
+        keep_id=models.Min('id'), count=models.Count('id')
+    ).filter(count__gt=1).order_by()
+    for group in duplicates:
+        Follow.objects.filter(
+            user_id=group['user'], author_id=group['author']
+        ).exclude(pk=group['keep_id']).delete()
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Follow = apps.get_model('users', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User.objects.update(
+        followers_count=count_related(Follow, 'author'),
+        recipes_count=count_related(Recipe, 'author')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество рецептов'),
+        ),
+        migrations.RunPython(
+            delete_duplicate_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
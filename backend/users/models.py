@@ -33,6 +33,21 @@ class User(AbstractUser):
         verbose_name='Фамилия',
         help_text='Укажите Вашу фамилию',
     )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False,
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Количество подписок',
+        default=0,
+        editable=False,
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Пользователь'